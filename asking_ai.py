@@ -1,11 +1,18 @@
+import threading
+import time
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from apscheduler.schedulers.background import BackgroundScheduler
-from database import Base, engine
-from services.pdf_service import extract_pdf_chunks
-from services.rag_pipeline import load_json_data, build_tfidf_matrix
+from database import Base, engine, SessionLocal, add_missing_columns
+from services.cache_service import enforce_cache_limits
+from services.metrics import render_metrics
+from services.index_status import index_states, track_build
+from services.pdf_index import pdf_index
+from services.pdf_service import extract_pdf_chunks, build_pdf_index
+from services.rag_pipeline import load_json_data, build_json_index, refresh_json_index, json_index
 from routers import code_execution, lessons, pdfs, practical_tests, rag
-from core.config import PDF_CHUNKS, JSON_DATA
+from core.config import RAG_CACHE_EVICTION_INTERVAL_MINUTES, JSON_REFRESH_INTERVAL_MINUTES, JSON_COMPACT_INTERVAL_HOURS
 
 # Initialize FastAPI app
 app = FastAPI()
@@ -19,35 +26,82 @@ app.add_middleware(
 
 # Create tables if not exist
 Base.metadata.create_all(bind=engine)
+add_missing_columns()
+
+STARTED_AT = time.time()
+
+def build_pdf_retrieval() -> int:
+    chunks = extract_pdf_chunks()
+    print(f"Loaded {len(chunks)} PDF documents")
+    build_pdf_index(chunks)
+    return len(pdf_index)
+
+def build_json_retrieval() -> int:
+    entries = load_json_data()
+    if not entries:
+        raise RuntimeError("no JSON knowledge entries loaded")
+    # Built off the request path; searches keep using the previous snapshot until the swap
+    index = build_json_index(entries)
+    return len(index)
+
+def refresh_json_retrieval() -> int:
+    entries = load_json_data()
+    if not entries:
+        raise RuntimeError("no JSON knowledge entries loaded")
+    return len(refresh_json_index(entries))
 
 def refresh_knowledge_base():
-    print("Refreshing knowledge base...")
-    load_json_data()
-    if JSON_DATA:
-        build_tfidf_matrix()
+    # Cheap when entries were only added: just those are indexed
+    track_build("json", refresh_json_retrieval)
+
+def compact_knowledge_base():
+    print("Compacting knowledge base index...")
+    track_build("json", build_json_retrieval)
+
+def evict_rag_cache():
+    db = SessionLocal()
+    try:
+        stats = enforce_cache_limits(db)
+        print(f"RAG cache eviction: {stats}")
+    except Exception as e:
+        print(f"RAG cache eviction failed: {e}")
+    finally:
+        db.close()
 
 # Startup initialization
 @app.on_event("startup")
 def startup_event():
-    global PDF_CHUNKS
-    
-    # Load PDF chunks
-    PDF_CHUNKS = extract_pdf_chunks()
-    print(f"Loaded {len(PDF_CHUNKS)} PDF documents")
-    
-    # Load JSON data
-    load_json_data()
-    
-    # Build TF-IDF matrix
-    if JSON_DATA:
-        build_tfidf_matrix()
-        print("Built TF-IDF matrix for JSON knowledge base")
-    
+    # Build the retrieval indexes in the background so the server accepts requests
+    # right away; /ragAI answers without a source until its index is ready (see /readyz)
+    for name, build in (("pdf", build_pdf_retrieval), ("json", build_json_retrieval)):
+        threading.Thread(target=track_build, args=(name, build), name=f"build-{name}-index", daemon=True).start()
+
     # Start background scheduler
     scheduler = BackgroundScheduler()
-    scheduler.add_job(refresh_knowledge_base, 'interval', hours=24)
+    scheduler.add_job(refresh_knowledge_base, 'interval', minutes=JSON_REFRESH_INTERVAL_MINUTES)
+    scheduler.add_job(compact_knowledge_base, 'interval', hours=JSON_COMPACT_INTERVAL_HOURS)
+    scheduler.add_job(evict_rag_cache, 'interval', minutes=RAG_CACHE_EVICTION_INTERVAL_MINUTES)
     scheduler.start()
 
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Liveness: the process is up and serving
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok", "uptime_seconds": round(time.time() - STARTED_AT, 1)}
+
+# Readiness: 503 until every retrieval index has been built
+@app.get("/readyz")
+def readyz():
+    indexes = index_states()
+    ready = all(state["ready"] for state in indexes.values())
+    # "snapshots" shows a background refresh in progress while the previous snapshot keeps serving
+    return JSONResponse({"ready": ready, "indexes": indexes, "snapshots": {"json": json_index.stats()}},
+                        status_code=200 if ready else 503)
+
 # Include routers
 app.include_router(rag.router)
 app.include_router(practical_tests.router)
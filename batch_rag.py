@@ -0,0 +1,64 @@
+"""Pre-generate /ragAI explanations for a list of questions through /ragAI/batch.
+
+    python batch_rag.py questions.txt -o answers.jsonl
+    python batch_rag.py questions.json --url http://localhost:8000 --concurrency 8
+
+Questions come one per line, or as a JSON list of strings or of objects with a
+"question" field. Each answer is written as one JSON line as soon as it arrives.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+
+def read_queries(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            items = json.load(f)
+            return [item["question"] if isinstance(item, dict) else str(item) for item in items]
+        return [line.strip() for line in f if line.strip()]
+
+def run_batch(url: str, queries: List[str], concurrency: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Yield the endpoint's events (``result``, ``error``, then ``done``) as they stream in."""
+    response = requests.post(f"{url.rstrip('/')}/ragAI/batch", json={"queries": queries, "concurrency": concurrency},
+                             stream=True, timeout=(10, None))
+    response.raise_for_status()
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("data: "):
+                yield json.loads(line[len("data: "):])
+    finally:
+        response.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk question answering against /ragAI/batch")
+    parser.add_argument("questions", help="Text file (one question per line) or JSON list")
+    parser.add_argument("-o", "--output", help="JSON lines output file (default: stdout)")
+    parser.add_argument("--url", default="http://localhost:8000", help="Base URL of the FastAPI server")
+    parser.add_argument("--concurrency", type=int, help="Queries answered at once (server default if omitted; the server caps it)")
+    args = parser.parse_args()
+
+    queries = read_queries(args.questions)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for event in run_batch(args.url, queries, args.concurrency):
+            if event["event"] == "done":
+                print(f"[BATCH] Done: {event['answered']} answered, {event['cached']} cached, "
+                      f"{event['failed']} failed", file=sys.stderr)
+                continue
+            record = {"index": event["index"], "query": event["query"]}
+            if event["event"] == "result":
+                record.update(final_answer=event["data"]["final_answer"], cached=event["cached"])
+            else:
+                record["error"] = event["detail"]
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            print(f"[BATCH] {event['event']} #{event['index']}: {event['query'][:50]}", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""Replay a query corpus through the /ragAI pipeline against the stub LLM and report latencies.
+
+    python -m benchmarks.run_benchmark --repeat 2 --concurrency 4 -o benchmarks/results/baseline.json
+    python -m benchmarks.run_benchmark --compare benchmarks/results/baseline.json
+
+Reports end-to-end and per-stage p50/p95/p99, retrieval timings, cache hit
+ratios and per-deployment model latency, and saves them as JSON. With
+``--compare`` the run is checked against an earlier result and exits non-zero
+when a tracked percentile regresses by more than ``--max-regression``.
+
+The pipeline runs in-process with its cache in a scratch directory (``--workdir``),
+so the real rag_cache.db is never touched.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_QUERIES = os.path.join(REPO_ROOT, "benchmarks", "queries.txt")
+DEFAULT_PDF_DIR = os.path.join(REPO_ROOT, "frontend", "Lecture Notes-20250622")
+DEFAULT_LESSON_DIR = os.path.join(REPO_ROOT, "lessons_raw")
+TRACKED_PERCENTILES = ("p50", "p95", "p99")
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    arr = np.asarray(values, dtype=float)
+    return {
+        "count": len(values),
+        "mean": round(float(arr.mean()), 4),
+        "p50": round(float(np.percentile(arr, 50)), 4),
+        "p95": round(float(np.percentile(arr, 95)), 4),
+        "p99": round(float(np.percentile(arr, 99)), 4),
+        "max": round(float(arr.max()), 4),
+    }
+
+def read_queries(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+def load_json_corpus(paths: List[str]) -> List[Dict[str, Any]]:
+    """JSON knowledge entries from ``paths``, or the lesson sections as title/content entries."""
+    entries = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            entries.extend(json.load(f))
+    if not paths:
+        for path in sorted(glob.glob(os.path.join(DEFAULT_LESSON_DIR, "*.json"))):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    lesson = json.load(f)
+            except ValueError as e:
+                print(f"[BENCH] Skipping {os.path.basename(path)}: {e}")
+                continue
+            entries.extend({"title": s.get("heading", ""), "content": s.get("content", "")}
+                           for s in lesson.get("sections", []))
+    return entries
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def setup_knowledge_base(json_paths: List[str], pdf_dir: Optional[str]) -> Dict[str, float]:
+    """Install the retrieval corpora the pipeline searches and time the builds."""
+    from services import rag_pipeline
+    from services.index_status import track_build
+    from services.pdf_index import pdf_index
+    from services.pdf_service import extract_pdf_chunks, build_pdf_index
+    import core.config
+
+    timings = {}
+    chunks = {}
+
+    def build_json() -> int:
+        entries = load_json_corpus(json_paths)
+        if entries:
+            rag_pipeline.build_json_index(entries)
+        return len(entries)
+
+    def build_pdf() -> int:
+        start = time.perf_counter()
+        if pdf_dir and os.path.isdir(pdf_dir):
+            core.config.PDF_DIR = pdf_dir
+            import services.pdf_service as pdf_service
+            pdf_service.PDF_DIR = pdf_dir
+            chunks.update(extract_pdf_chunks())
+        timings["pdf_extract"] = round(time.perf_counter() - start, 4)
+        start = time.perf_counter()
+        build_pdf_index(chunks)
+        timings["pdf_index_build"] = round(time.perf_counter() - start, 4)
+        return len(pdf_index)
+
+    # Through track_build, so /ragAI sees both indexes as ready
+    start = time.perf_counter()
+    track_build("json", build_json)
+    timings["json_index_build"] = round(time.perf_counter() - start, 4)
+    track_build("pdf", build_pdf)
+    print(f"[BENCH] Knowledge base: {len(rag_pipeline.json_index.current() or [])} JSON entries, {len(chunks)} PDFs")
+    return timings
+
+async def replay(queries: List[str], concurrency: int) -> List[Dict[str, Any]]:
+    """Run every query through /ragAI's handler, at most ``concurrency`` at a time, in corpus order."""
+    from fastapi import HTTPException
+    from routers.rag import rag_ai, ExplainRequest
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(position: int, query: str) -> Dict[str, Any]:
+        async with semaphore:
+            start = time.perf_counter()
+            record = {"position": position, "query": query}
+            try:
+                result = await rag_ai(ExplainRequest(user_input=query))
+                debug_log = result["debug_log"]
+                record.update(ok=True, timings=debug_log.get("timings", {}),
+                              mode=debug_log.get("mode"),
+                              cached="generation" not in debug_log.get("timings", {}),
+                              semantic="semantic_cache" in debug_log)
+            except HTTPException as e:
+                record.update(ok=False, error=f"{e.status_code}: {e.detail}")
+            except Exception as e:
+                record.update(ok=False, error=str(e))
+            record["seconds"] = time.perf_counter() - start
+            return record
+
+    return await asyncio.gather(*[one(i, q) for i, q in enumerate(queries)])
+
+def summarise(records: List[Dict[str, Any]], wall_seconds: float) -> Dict[str, Any]:
+    ok = [r for r in records if r["ok"]]
+    stages: Dict[str, List[float]] = {}
+    models: Dict[str, List[float]] = {}
+    for r in ok:
+        for name, seconds in r["timings"].items():
+            if name.startswith("model:"):
+                models.setdefault(name[len("model:"):], []).append(seconds)
+            elif name != "total":
+                stages.setdefault(name, []).append(seconds)
+    modes: Dict[str, int] = {}
+    for r in ok:
+        if not r["cached"]:
+            modes[r["mode"] or "full"] = modes.get(r["mode"] or "full", 0) + 1
+    return {
+        "end_to_end": {**percentiles([r["seconds"] for r in ok]), "errors": len(records) - len(ok),
+                       "throughput_qps": round(len(ok) / wall_seconds, 3) if wall_seconds else None},
+        "cold": percentiles([r["seconds"] for r in ok if not r["cached"]]),
+        "cached": percentiles([r["seconds"] for r in ok if r["cached"]]),
+        "stages": {name: percentiles(values) for name, values in sorted(stages.items())},
+        "retrieval": {name: percentiles(stages[name]) for name in sorted(stages) if "retrieval" in name},
+        "models": {name: percentiles(values) for name, values in sorted(models.items())},
+        "modes": modes,
+        "errors": [{"query": r["query"], "error": r["error"]} for r in records if not r["ok"]][:20],
+    }
+
+def cache_report(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    from services.cache_service import stage_cache
+    from services.semantic_cache import semantic_cache
+    from services.singleflight import singleflight_stats
+
+    ok = [r for r in records if r["ok"]]
+    return {
+        "final_hit_ratio": round(sum(r["cached"] for r in ok) / len(ok), 4) if ok else None,
+        "semantic_hit_ratio": round(sum(r["semantic"] for r in ok) / len(ok), 4) if ok else None,
+        "stages": stage_cache.get_stats(),
+        "semantic": semantic_cache.get_stats(),
+        "singleflight": singleflight_stats(),
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float,
+            min_delta: float = 0.005) -> List[str]:
+    """Tracked percentiles that got slower than ``baseline`` by more than ``max_regression`` (a fraction).
+
+    Cold and cached runs are compared separately since the mix depends on ``--repeat``;
+    slowdowns under ``min_delta`` seconds are treated as noise.
+    """
+    regressions = []
+    sections = [(name, current[name], baseline.get(name, {})) for name in ("cold", "cached")]
+    sections += [(f"stages.{name}", stats, baseline.get("stages", {}).get(name, {}))
+                 for name, stats in current["stages"].items()]
+    for label, now, before in sections:
+        for key in TRACKED_PERCENTILES:
+            if key in now and before.get(key):
+                change = (now[key] - before[key]) / before[key]
+                print(f"  {label:32s} {key}: {before[key]:.4f}s -> {now[key]:.4f}s ({change:+.1%})")
+                if change > max_regression and now[key] - before[key] > min_delta:
+                    regressions.append(f"{label} {key} {change:+.1%}")
+    return regressions
+
+def print_report(report: Dict[str, Any]):
+    e2e = report["end_to_end"]
+    print(f"\n[BENCH] {e2e['count']} ok, {e2e['errors']} errors, {e2e.get('throughput_qps')} q/s")
+    print(f"{'':28s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'n':>6s}")
+    rows = [("end_to_end", e2e), ("cold", report["cold"]), ("cached", report["cached"])]
+    rows += [(f"stage:{name}", stats) for name, stats in report["stages"].items()]
+    rows += [(f"model:{name}", stats) for name, stats in report["models"].items()]
+    for name, stats in rows:
+        if stats.get("count"):
+            print(f"{name:28s} {stats['p50']:8.4f} {stats['p95']:8.4f} {stats['p99']:8.4f} {stats['count']:6d}")
+    cache = report["cache"]
+    print(f"final-result hit ratio {cache['final_hit_ratio']}, semantic hit ratio {cache['semantic_hit_ratio']}, "
+          f"modes {report['modes']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline /ragAI benchmark against a stub LLM server")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="Query corpus, one per line")
+    parser.add_argument("--repeat", type=int, default=2, help="Replay the corpus this many times (later passes hit the cache)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--profile", help="Stub latency/response profile (JSON)")
+    parser.add_argument("--base-url", help="Use an already running server instead of starting the stub")
+    parser.add_argument("--json-data", nargs="*", default=[], help="JSON knowledge files (default: lesson sections)")
+    parser.add_argument("--pdf-dir", default=DEFAULT_PDF_DIR)
+    parser.add_argument("--workdir", help="Directory for the benchmark's rag_cache.db (default: a fresh temp dir)")
+    parser.add_argument("-o", "--output", help="Write the report to this JSON file")
+    parser.add_argument("--compare", help="Earlier report to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="Allowed slowdown per tracked percentile")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="Ignore slowdowns smaller than this many seconds")
+    args = parser.parse_args()
+
+    queries = read_queries(os.path.abspath(args.queries))
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    json_paths = [os.path.abspath(p) for p in args.json_data]
+    pdf_dir = os.path.abspath(args.pdf_dir) if args.pdf_dir else None
+
+    from benchmarks.stub_llm import load_profile, start_stub_server
+    profile = load_profile(args.profile)
+    stub = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        server, stub = start_stub_server(profile)
+        base_url = f"http://127.0.0.1:{server.server_port}"
+    # Must be set before the app modules import core.config
+    os.environ["GENAI_BASE_URL"] = base_url
+    os.environ.setdefault("GENAI_API_key", "benchmark")
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="rag-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)  # database.py opens ./rag_cache.db relative to the working directory
+
+    from database import Base, engine, add_missing_columns
+    import models  # noqa: F401  (registers the cache tables)
+    import core.config as config
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+
+    build_timings = setup_knowledge_base(json_paths, pdf_dir)
+    corpus = queries * max(1, args.repeat)
+    print(f"[BENCH] Replaying {len(corpus)} queries ({len(set(queries))} distinct) at concurrency {args.concurrency} "
+          f"against {base_url}, cache in {workdir}")
+
+    started = time.perf_counter()
+    records = asyncio.run(replay(corpus, args.concurrency))
+    wall_seconds = time.perf_counter() - started
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "base_url": base_url,
+            "queries": len(corpus),
+            "distinct_queries": len(set(queries)),
+            "repeat": args.repeat,
+            "concurrency": args.concurrency,
+            "wall_seconds": round(wall_seconds, 4),
+            "profile": profile if stub else None,
+            "config": {"fast_mode": config.FAST_MODE, "generation_models": config.GENERATION_MODELS,
+                       "verification_models": config.VERIFICATION_MODELS, "retrieval_version": config.RETRIEVAL_VERSION},
+        },
+        "build": build_timings,
+        **summarise(records, wall_seconds),
+        "cache": cache_report(records),
+        "stub_calls": dict(sorted(stub.calls.items())) if stub else None,
+    }
+    print_report(report)
+
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[BENCH] Saved report to {output}")
+
+    if baseline_path:
+        with open(baseline_path, "r") as f:
+            baseline = json.load(f)
+        print(f"\n[BENCH] Compared with {baseline_path} ({baseline['meta'].get('commit')}):")
+        regressions = compare(report, baseline, args.max_regression, args.min_delta)
+        if regressions:
+            print(f"[BENCH] Regressions over {args.max_regression:.0%}: " + "; ".join(regressions))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""Local stand-in for the GenAI REST API, for benchmarking without the real endpoint.
+
+Speaks the protocol services/model_service.py uses:
+
+    POST /deployments/<name>/chat/completions   (also ``stream: true`` server-sent events)
+    POST /deployments/<name>/generate_content   (Gemini)
+    POST /deployments/<name>/embeddings
+
+Latency, error rate and canned responses come from a JSON profile (see
+stub_profile.json). Run it on its own to point the real server at it:
+
+    python -m benchmarks.stub_llm --port 8089 --profile benchmarks/stub_profile.json
+    GENAI_BASE_URL=http://127.0.0.1:8089 uvicorn asking_ai:app
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_PROFILE = {
+    "seed": 42,
+    "embedding_dim": 64,
+    # {"dist": "fixed", "seconds"} | {"dist": "uniform", "low", "high"} |
+    # {"dist": "normal", "mean", "std"} | {"dist": "lognormal", "median", "sigma"}
+    "latency": {
+        "default": {"dist": "lognormal", "median": 0.05, "sigma": 0.3},
+        "embedding": {"dist": "fixed", "seconds": 0.01},
+    },
+    "error_rate": {"default": 0.0},
+    "stream_chunk_words": 4,
+    "vary_answers_by_model": False,  # identical answers let fast mode skip verification
+    # First match on the system prompt wins; "{query}" is replaced by the user message
+    "responses": [
+        {"stage": "routing", "text": "PDF and JSON"},
+        {"stage": "batch_routing", "text": "{numbered}: PDF and JSON"},
+        {"stage": "compression", "text": "Key facts for the question: {query}"},
+        {"stage": "generation", "text": "A short beginner-friendly explanation. {query}"},
+        {"stage": "verification", "text": "The answers are accurate and complete."},
+        {"stage": "arbitration", "text": "Final explanation with an example. {query}"},
+    ],
+}
+
+def load_profile(path: Optional[str] = None) -> Dict[str, Any]:
+    profile = json.loads(json.dumps(DEFAULT_PROFILE))
+    if path:
+        with open(path, "r") as f:
+            overrides = json.load(f)
+        for key, value in overrides.items():
+            if isinstance(value, dict) and isinstance(profile.get(key), dict):
+                profile[key].update(value)
+            else:
+                profile[key] = value
+    return profile
+
+def _stage_prompts() -> Dict[str, str]:
+    # Imported here so callers can set GENAI_BASE_URL after starting the stub but before core.config loads
+    from core.config import ROUTING_PROMPT, COMPRESSION_PROMPT, ANSWER_PROMPT, VERIFICATION_PROMPT, ARBITRATION_PROMPT
+    return {
+        "routing": ROUTING_PROMPT,
+        "compression": COMPRESSION_PROMPT,
+        "generation": ANSWER_PROMPT,
+        "verification": VERIFICATION_PROMPT,
+        "arbitration": ARBITRATION_PROMPT,
+    }
+
+class StubLLM:
+    """Profile-driven responses and latencies; shared by every request handler thread."""
+
+    def __init__(self, profile: Dict[str, Any]):
+        self.profile = profile
+        self.random = random.Random(profile.get("seed"))
+        self.lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+        self.stage_prompts: Optional[Dict[str, str]] = None
+
+    def stage_of(self, system_prompt: str) -> str:
+        if system_prompt.startswith("Route each"):
+            return "batch_routing"
+        if self.stage_prompts is None:
+            self.stage_prompts = _stage_prompts()
+        for stage, prompt in self.stage_prompts.items():
+            if system_prompt == prompt:
+                return stage
+        return "other"
+
+    def _pick(self, table: Dict[str, Any], deployment: str, kind: str) -> Any:
+        return table.get(deployment, table.get(kind, table.get("default")))
+
+    def latency(self, deployment: str, kind: str) -> float:
+        spec = self._pick(self.profile["latency"], deployment, kind) or {"dist": "fixed", "seconds": 0}
+        with self.lock:
+            dist = spec.get("dist", "fixed")
+            if dist == "uniform":
+                seconds = self.random.uniform(spec["low"], spec["high"])
+            elif dist == "normal":
+                seconds = self.random.gauss(spec["mean"], spec["std"])
+            elif dist == "lognormal":
+                seconds = spec["median"] * self.random.lognormvariate(0, spec["sigma"])
+            else:
+                seconds = spec.get("seconds", 0)
+        return max(0.0, seconds)
+
+    def fails(self, deployment: str, kind: str) -> bool:
+        rate = self._pick(self.profile["error_rate"], deployment, kind) or 0.0
+        with self.lock:
+            return self.random.random() < rate
+
+    def count(self, key: str):
+        with self.lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    def chat_text(self, deployment: str, messages: List[Dict[str, str]]) -> str:
+        system_prompt = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        query = messages[-1]["content"] if messages else ""
+        stage = self.stage_of(system_prompt)
+        self.count(f"chat:{stage}")
+        for response in self.profile["responses"]:
+            if response.get("stage") == stage or (response.get("match") and system_prompt.startswith(response["match"])):
+                text = response["text"]
+                if stage == "batch_routing":
+                    return "\n".join(text.replace("{numbered}", line.split(".", 1)[0])
+                                     for line in query.splitlines() if line.strip())
+                text = text.replace("{query}", query[:200])
+                if stage == "generation" and self.profile.get("vary_answers_by_model"):
+                    text = f"[{deployment}] {text}"
+                return text
+        return f"Stub reply from {deployment}."
+
+    def embedding(self, text: str) -> List[float]:
+        # Deterministic per normalised text: repeats match exactly, different texts are near-orthogonal
+        seed = int(hashlib.md5(text.lower().strip().encode()).hexdigest()[:8], 16)
+        vector = np.random.default_rng(seed).standard_normal(self.profile["embedding_dim"])
+        return (vector / np.linalg.norm(vector)).round(6).tolist()
+
+def make_handler(stub: StubLLM):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status: int, body: Dict[str, Any]):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_chunk(self, data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            parts = self.path.split("?", 1)[0].strip("/").split("/")
+            if len(parts) < 3 or parts[0] != "deployments":
+                self._send_json(404, {"error": "unknown path"})
+                return
+            deployment, endpoint = parts[1], "/".join(parts[2:])
+            kind = "embedding" if endpoint == "embeddings" else "chat"
+
+            delay = stub.latency(deployment, kind)
+            if stub.fails(deployment, kind):
+                time.sleep(delay)
+                stub.count(f"error:{deployment}")
+                self._send_json(500, {"error": "injected failure"})
+                return
+
+            if kind == "embedding":
+                inputs = body.get("input")
+                inputs = [inputs] if isinstance(inputs, str) else inputs or []
+                stub.count("embedding")
+                time.sleep(delay)
+                self._send_json(200, {"data": [{"embedding": stub.embedding(t), "index": i} for i, t in enumerate(inputs)],
+                                      "usage": {"prompt_tokens": sum(len(t.split()) for t in inputs)}})
+                return
+
+            if endpoint == "generate_content":
+                messages = [{"role": c["role"], "content": c["parts"][0]["text"]} for c in body.get("contents", [])]
+                text = stub.chat_text(deployment, messages)
+                time.sleep(delay)
+                self._send_json(200, {"candidates": [{"content": {"parts": [{"text": text}]}}]})
+                return
+
+            messages = body.get("messages", [])
+            text = stub.chat_text(deployment, messages)
+            usage = {"prompt_tokens": sum(len(m.get("content", "").split()) for m in messages),
+                     "completion_tokens": len(text.split())}
+            if not body.get("stream"):
+                time.sleep(delay)
+                self._send_json(200, {"choices": [{"message": {"role": "assistant", "content": text}}], "usage": usage})
+                return
+
+            # Streamed: the sampled latency is spread across the chunks
+            words = text.split(" ")
+            size = max(1, stub.profile.get("stream_chunk_words", 4))
+            chunks = [" ".join(words[i:i + size]) + (" " if i + size < len(words) else "") for i in range(0, len(words), size)]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in chunks:
+                time.sleep(delay / len(chunks))
+                self._send_chunk(f"data: {json.dumps({'choices': [{'delta': {'content': chunk}}]})}\n\n".encode())
+            self._send_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+def start_stub_server(profile: Dict[str, Any], host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, StubLLM]:
+    """Serve the stub from a daemon thread; ``port=0`` picks a free port."""
+    stub = StubLLM(profile)
+    server = ThreadingHTTPServer((host, port), make_handler(stub))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stub
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub GenAI server for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--profile", help="JSON latency/response profile")
+    args = parser.parse_args()
+
+    server, _ = start_stub_server(load_profile(args.profile), args.host, args.port)
+    print(f"Stub LLM listening on http://{args.host}:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,10 @@ import os
 API_KEY = os.getenv("GENAI_API_key")
 PAIZA_API_KEY = os.getenv("PAIZA_API_KEY", "guest")
 LESSON_DIR = "/Users/hei/IdeaProjects/fyp/lessons_raw"
-PDF_DIR = "/Users/hei/IdeaProjects/fyp/frontend/Lecture Notes-20250622"
+PDF_DIR = os.getenv("PDF_DIR", "/Users/hei/IdeaProjects/fyp/frontend/Lecture Notes-20250622")
 JSON_PATH = "/Users/hei/IdeaProjects/fyp/oracle_java_tutorials_clean.json"
-BASE_URL = "https://genai.hkbu.edu.hk/api/v0/rest"
+BASE_URL = os.getenv("GENAI_BASE_URL", "https://genai.hkbu.edu.hk/api/v0/rest")  # override to point at a local stand-in
 BASE_PATH = "/Users/hei/IdeaProjects/fyp/practical_tests/set1/questions"
-PDF_CHUNKS = None  # Will be initialized at startup
-JSON_DATA = []     # Will be loaded at startup
 
 # Model configuration
 MODEL_API_VERSIONS = {
@@ -35,3 +33,136 @@ COMPRESSION_PROMPT = "Condense Java-related information from context while prese
 ANSWER_PROMPT = "As a Java tutor, answer clearly for beginners using ONLY provided context. If context doesn't contain answer, say 'I don't know'."
 VERIFICATION_PROMPT = "Check answers against context for: 1. Factual accuracy 2. Missing information 3. Hallucinations. Be specific about errors."
 ARBITRATION_PROMPT = "Synthesize verified information into one beginner-friendly Java explanation. Use simple analogies and include short code examples where helpful."
+
+# Pipeline model lineup
+ROUTING_MODEL = "gpt-5-mini"
+COMPRESSION_MODEL = "gpt-5-mini"
+GENERATION_MODELS = ["gpt-5", "gpt-5-mini"]
+VERIFICATION_MODELS = ["gpt-5", "gpt-5-mini"]
+ARBITRATION_MODEL = "gpt-5-mini"
+
+# Per-stage timeouts (seconds) for the /ragAI pipeline
+STAGE_TIMEOUTS = {
+    "routing": 20,
+    "compression": 30,
+    "generation": 35,
+    "verification": 35,
+    "arbitration": 40,
+}
+
+# Model client connection pooling (one pool per BASE_URL)
+MODEL_CLIENT_POOL_CONNECTIONS = 4   # distinct hosts kept warm
+MODEL_CLIENT_POOL_MAXSIZE = 32      # keep-alive connections (and async workers) per host
+MODEL_CLIENT_MAX_RETRIES = 2        # transport-level retries for connect errors / 429 / 5xx
+MODEL_CLIENT_BACKOFF = 0.5          # seconds, doubled on every retry
+MODEL_CLIENT_TIMEOUT = 30
+
+# Tail-latency protection: hedge slow chat calls to an equivalent deployment, trip breakers on failing ones
+MODEL_EQUIVALENTS = {
+    "gpt-5": ["gpt-4.1"],
+    "gpt-4.1": ["gpt-5"],
+    "gpt-5-mini": ["gpt-4.1-mini"],
+    "gpt-4.1-mini": ["gpt-5-mini"],
+}
+HEDGING_ENABLED = True
+HEDGE_PERCENTILE = 95        # hedge once a call outlives this percentile of the deployment's recent latencies
+HEDGE_MIN_SAMPLES = 20       # below this many samples use HEDGE_DEFAULT_DELAY
+HEDGE_WINDOW = 200           # recent successful latencies kept per deployment
+HEDGE_DEFAULT_DELAY = 10.0   # seconds
+HEDGE_MIN_DELAY = 0.5        # never hedge sooner than this
+CIRCUIT_FAILURE_THRESHOLD = 5   # consecutive failures that open a deployment's breaker
+CIRCUIT_COOLDOWN = 30           # seconds open before a single trial call is let through
+
+# Semantic cache: reuse answers for paraphrased questions
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_MODEL = "text-embedding-3-large"
+SEMANTIC_CACHE_THRESHOLD = 0.92   # cosine similarity needed to reuse a cached answer
+SEMANTIC_CACHE_MAX_ENTRIES = 5000
+
+# In-process LRU in front of rag_cache.db
+STAGE_CACHE_MAX_QUERIES = 1024   # queries (with all their stages) kept in memory
+STAGE_CACHE_TTL = 3600           # seconds before a memory entry is re-read from SQLite
+
+# rag_cache lifetime and size
+RETRIEVAL_VERSION = 5   # bump when PDF/JSON retrieval changes so cached contexts are recomputed
+STAGE_TTLS = {          # seconds; None keeps the stage until it is evicted for size
+    "routing": 30 * 86400,
+    "pdf_context": 7 * 86400,
+    "pdf_matches": 7 * 86400,
+    "json_context": 86400,  # the JSON knowledge base is refreshed daily
+    "narrowed": 7 * 86400,
+    "final_result": 7 * 86400,
+}
+RAG_CACHE_MAX_BYTES = 200 * 1024 * 1024
+RAG_CACHE_EVICTION_POLICY = "lru"        # "lru" or "lfu"
+RAG_CACHE_EVICTION_INTERVAL_MINUTES = 30
+RAG_CACHE_COMPRESS_MIN_BYTES = 2048      # zlib-compress stage content larger than this
+
+# Adaptive fast mode: when the generated answers already agree, verification adds little.
+# Opt-in: "off" always runs full checking; "single" keeps one verifier and arbitration;
+# "skip" is the aggressive setting and returns the first answer with no verification or arbitration.
+FAST_MODE = "off"
+AGREEMENT_METHOD = "embedding"    # "embedding" or "overlap"; embedding falls back to overlap on failure
+AGREEMENT_THRESHOLD = 0.95
+AGREEMENT_MODEL = "text-embedding-3-large"
+
+# Token budgets for each prompt section, per deployment ("default" applies to any model not listed)
+CONTEXT_TOKEN_BUDGETS = {
+    "default": {
+        "compression": 1500,
+        "generation": 1000,
+        "verification_context": 750,
+        "verification_answers": 500,
+        "arbitration_answers": 750,
+        "arbitration_verifications": 500,
+        "conversation": 800,          # summary + recent turns together
+        "conversation_summary": 300,  # the rolling summary alone
+    },
+    "gpt-5": {"generation": 1500, "verification_context": 1000, "verification_answers": 750},
+}
+SNIPPET_DEDUP_THRESHOLD = 0.8  # shingle overlap above which a snippet counts as a duplicate
+
+# Batch /ragAI (exam pre-generation)
+BATCH_ROUTING_PROMPT = ("Route each numbered query to 'PDF' (Java concepts), 'JSON' (API/syntax), or 'Both'. "
+                        "Reply with one line per query in the form '<number>: <route>' and nothing else.")
+BATCH_ROUTING_SIZE = 25    # queries per multi-query routing call
+BATCH_CONCURRENCY = 4      # queries running the remaining stages at once
+BATCH_CONCURRENCY_MAX = 8  # cap on a client-requested concurrency; each query fans out several model calls
+BATCH_MAX_QUERIES = 500
+
+# Conversation memory: recent turns verbatim, older ones folded into a rolling summary per session
+CONVERSATION_DB_PATH = "conversation_history.db"
+MEMORY_RECENT_TURNS = 4
+MEMORY_SUMMARY_MODEL = "gpt-5-mini"
+MEMORY_SUMMARY_PROMPT = ("Update the running summary of a Java tutoring conversation with the new turns. "
+                         "Keep the topics covered, what the student struggled with and any code they are working on. "
+                         "Reply with the updated summary only.")
+
+# PDF lecture-note retrieval: BM25 over overlapping word windows of each page
+PDF_CHUNK_WORDS = 120
+PDF_CHUNK_OVERLAP = 30
+PDF_TOP_K = 5
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Extracted PDF page text, reused until a file's size/mtime (then content hash) changes
+PDF_CACHE_DB_PATH = "pdf_extract_cache.db"
+# PDFs (and page ranges of large PDFs) that need parsing are spread over a process pool
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+PDF_PAGES_PER_TASK = 16
+
+# BM25F over the JSON knowledge entries: per-field weight and length normalisation
+JSON_FIELD_WEIGHTS = {"question": 3.0, "title": 2.0, "answer": 1.0, "content": 1.0, "code": 0.5}
+JSON_FIELD_B = {"question": 0.5, "title": 0.5, "answer": 0.75, "content": 0.75, "code": 0.75}
+BM25F_K1 = 1.2
+# Vocabulary and CSR postings for the JSON corpus, keyed by its fingerprint
+JSON_INDEX_DIR = "json_index"
+# New JSON entries are appended to the index on every refresh; compaction re-indexes everything
+JSON_REFRESH_INTERVAL_MINUTES = 10
+JSON_COMPACT_INTERVAL_HOURS = 24
+
+# Approximate dense search in KnowledgeBaseDB (java8_rag.py): IVF lists are used once the knowledge base
+# has KB_ANN_MIN_DOCS embeddings; KB_ANN_LISTS=None picks 4*sqrt(n). More probes: higher recall, slower
+KB_ANN_MIN_DOCS = 20000
+KB_ANN_LISTS = None
+KB_ANN_NPROBE = 8
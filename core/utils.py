@@ -8,8 +8,48 @@ def get_model_type(model: str) -> str:
         return "gemini"
     return "deepseek"
 
+try:
+    import tiktoken  # exact counts for the GPT deployments (in requirements.txt)
+    _ENCODING = tiktoken.get_encoding("o200k_base")  # fetched and cached by tiktoken on first use
+except Exception:
+    _ENCODING = None  # not installed or encoding unavailable offline: count_tokens falls back to the estimate
+
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
 def approximate_token_count(text: str) -> int:
-    return int(len(text.split()) * 1.3)
+    """BPE-like estimate: long words split every ~4 letters, digits and symbols count separately.
+
+    Java code is full of punctuation, which a plain word count undercounts badly.
+    """
+    return sum(1 + (len(piece) - 1) // 4 if piece[0].isalpha() else 1 + (len(piece) - 1) // 3
+               for piece in _TOKEN_PIECES.findall(text))
+
+def count_tokens(text: str) -> int:
+    """Exact o200k_base token count via tiktoken, or ``approximate_token_count`` when tiktoken is unavailable.
+
+    The estimate is additive over lines and snippets, so budgets packed with it still hold.
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return approximate_token_count(text)
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Longest prefix of ``text`` within ``budget`` tokens, cut at a line break when possible."""
+    if count_tokens(text) <= budget:
+        return text
+    kept, used = [], 0
+    for line in text.splitlines(keepends=True):
+        cost = count_tokens(line)
+        if used + cost > budget:
+            if not kept:  # a single huge line: fall back to cutting inside it
+                words = line.split(" ")
+                while words and count_tokens(" ".join(words)) > budget:
+                    words = words[:max(1, len(words) * 3 // 4)] if len(words) > 1 else []
+                kept.append(" ".join(words))
+            break
+        kept.append(line)
+        used += cost
+    return "".join(kept).rstrip()
 
 def compress_text(text: str, max_lines: int = 50) -> str:
     lines = [line.strip() for line in text.splitlines() if line.strip()]
@@ -1,6 +1,7 @@
-from database import engine
+from database import engine, add_missing_columns
 from models import Base
 
 if __name__ == "__main__":
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
     print("Tables created.")
@@ -5,7 +5,14 @@ import json
 import sqlite3
 import time 
 from datetime import datetime
-from services.model_service import call_embedding_model
+from services.model_service import call_embedding_model, stream_model, ModelAPIError
+from services.conversation_memory import ConversationMemory
+from services.ranking import top_k as best_positions
+from services.embedding_store import encode_embedding, embedding_matrix
+from services.ann_index import load_or_build_ivf
+from core.config import KB_ANN_MIN_DOCS, KB_ANN_LISTS, KB_ANN_NPROBE
+import os
+import numpy as np
 import nltk
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
@@ -55,7 +62,7 @@ def setup_databases():
             metadata TEXT,  
             verified BOOLEAN DEFAULT FALSE,
             last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            embedding_vector TEXT,
+            embedding_vector BLOB,  -- float32; older databases hold TEXT until migrate_embeddings.py runs
             reasoning_steps TEXT,
             reflection_tokens TEXT 
         )
@@ -385,15 +392,14 @@ def retry_on_exception(retries=3, delay=5, backoff_factor=2):
         return wrapper
     return decorator
 
-@retry_on_exception(retries=5, delay=10, backoff_factor=2)
 def call_deepseek(prompt: str, model: str = "deepseek") -> str:
-    """Call DeepSeek API for text generation using the centralized model service"""
+    """Call DeepSeek API for text generation using the centralized model service.
+
+    Connection reuse and retry/backoff are handled by the pooled model client.
+    """
     messages = [{"role": "user", "content": prompt}]
     try:
-        response = call_model(model, messages)
-        if "Model API error" in response:
-            raise Exception(response)
-        return response
+        return call_model(model, messages)
     except Exception as e:
         print(f"An unexpected error occurred during DeepSeek call: {e}")
         return "Sorry, an unexpected error occurred while connecting to my knowledge source."
@@ -408,7 +414,7 @@ class KnowledgeBaseLoader:
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             for item in dataset:
-                embedding_str = ','.join(map(str, item['embedding'])) if item['embedding'] is not None else None
+                embedding_blob = encode_embedding(item['embedding'])
                 metadata_str = json.dumps(item['metadata'])
                 reasoning_steps_str = json.dumps(item['reasoning_steps']) # Store reasoning steps
                 reflection_tokens_str = json.dumps(item['reflection_tokens']) # Store reflection tokens
@@ -416,7 +422,7 @@ class KnowledgeBaseLoader:
                 cursor.execute(
                     """INSERT INTO knowledge_base (question, answer, code, metadata, embedding_vector, reasoning_steps, reflection_tokens) 
                        VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                    (item['question'], item['answer'], item['code'], metadata_str, embedding_str, reasoning_steps_str, reflection_tokens_str)
+                    (item['question'], item['answer'], item['code'], metadata_str, embedding_blob, reasoning_steps_str, reflection_tokens_str)
                 )
             conn.commit()
 
@@ -427,6 +433,11 @@ class KnowledgeBaseDB:
         self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
         self.bm25_index = None
         self.documents = []
+        self.doc_ids = np.empty(0, dtype=np.int64)   # row -> knowledge_base.id
+        self.doc_rows = {}                           # knowledge_base.id -> row
+        self.embedding_matrix = None                 # unit-length embeddings, one per embedded document
+        self.embedding_rows = np.empty(0, dtype=np.intp)  # embedding_matrix row -> document row
+        self.ann_index = None                        # IVF lists over embedding_matrix, for large knowledge bases
         self._load_knowledge_base()
 
     def _load_knowledge_base(self):
@@ -436,10 +447,11 @@ class KnowledgeBaseDB:
             cursor.execute("SELECT id, question, answer, code, embedding_vector, reasoning_steps, reflection_tokens FROM knowledge_base")
             
             self.documents = []
+            embeddings = []
             for row in cursor.fetchall():
-                db_id, question, answer, code, embedding_str, reasoning_steps_str, reflection_tokens_str = row
+                db_id, question, answer, code, embedding_blob, reasoning_steps_str, reflection_tokens_str = row
                 
-                embedding = np.array([float(x) for x in embedding_str.split(',')]) if embedding_str else None
+                embeddings.append(embedding_blob)
                 reasoning_steps = json.loads(reasoning_steps_str) if reasoning_steps_str else []
                 reflection_tokens = json.loads(reflection_tokens_str) if reflection_tokens_str else {}
 
@@ -448,11 +460,22 @@ class KnowledgeBaseDB:
                     'question': question,
                     'answer': answer,
                     'code': code,
-                    'embedding': embedding,
                     'reasoning_steps': reasoning_steps,
                     'reflection_tokens': reflection_tokens # Added reflection tokens
                 })
             
+            # Ranking arrays, built once so a search is only vector maths over them
+            self.doc_ids = np.array([doc['id'] for doc in self.documents], dtype=np.int64)
+            self.doc_rows = {doc['id']: row for row, doc in enumerate(self.documents)}
+            self.embedding_rows, matrix = embedding_matrix(embeddings)  # one np.frombuffer over all BLOBs
+            if len(self.embedding_rows):
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                self.embedding_matrix = matrix / np.where(norms > 0, norms, 1)
+                if len(matrix) >= KB_ANN_MIN_DOCS:
+                    n_lists = KB_ANN_LISTS or int(4 * np.sqrt(len(matrix)))
+                    self.ann_index = load_or_build_ivf(self.embedding_matrix,
+                                                       os.path.splitext(self.db_path)[0] + ".ivf.npz", n_lists)
+
             # Build BM25 index
             if self.documents:
                 tokenized_corpus = [
@@ -468,10 +491,6 @@ class KnowledgeBaseDB:
         stop_words = set(stopwords.words('english'))
         return [word for word in tokens if word.isalnum() and word not in stop_words]
 
-    def _cosine_similarity(self, v1, v2):
-        """Calculates cosine similarity between two vectors."""
-        return np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
-
     def _reciprocal_rank_fusion(self, results, k=60):
         """Applies Reciprocal Rank Fusion to combine ranked lists."""
         fused_scores = {}
@@ -492,34 +511,29 @@ class KnowledgeBaseDB:
         dense_results = []
         bm25_results = []
 
-        # Dense retrieval
-        if self.documents:
-            dense_scores = []
-            for i, doc in enumerate(self.documents):
-                if doc['embedding'] is not None:
-                    similarity = self._cosine_similarity(query_embedding, doc['embedding'])
-                    dense_scores.append((similarity, doc['id']))
-            dense_scores.sort(key=lambda x: x[0], reverse=True)
-            dense_results = [doc_id for score, doc_id in dense_scores[:top_k*2]] # Get more for RRF
+        # Dense retrieval: cosine similarity against every embedding in one product
+        if self.embedding_matrix is not None:
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            query_vector = query_vector / (np.linalg.norm(query_vector) or 1)
+            if self.ann_index is not None:
+                best = self.ann_index.search(self.embedding_matrix, query_vector, top_k*2, KB_ANN_NPROBE) # Get more for RRF
+            else:
+                dense_scores = self.embedding_matrix @ query_vector
+                best = best_positions(dense_scores, top_k*2) # Get more for RRF
+            dense_results = self.doc_ids[self.embedding_rows[best]].tolist()
 
         # BM25 retrieval
         if self.bm25_index and tokenized_query:
-            bm25_scores = self.bm25_index.get_scores(tokenized_query)
-            bm25_ranked_docs = sorted(
-                [(score, self.documents[i]['id']) for i, score in enumerate(bm25_scores)],
-                key=lambda x: x[0],
-                reverse=True
-            )
-            bm25_results = [doc_id for score, doc_id in bm25_ranked_docs[:top_k*2]] # Get more for RRF
+            bm25_scores = np.asarray(self.bm25_index.get_scores(tokenized_query))
+            bm25_results = self.doc_ids[best_positions(bm25_scores, top_k*2)].tolist() # Get more for RRF
 
         # Combine using RRF
         combined_ranks = self._reciprocal_rank_fusion([dense_results, bm25_results])
         
         final_results = []
-        doc_map = {doc['id']: doc for doc in self.documents}
         for doc_id in combined_ranks:
-            if doc_id in doc_map:
-                doc = doc_map[doc_id]
+            if doc_id in self.doc_rows:
+                doc = self.documents[self.doc_rows[doc_id]]
                 final_results.append((doc['question'], doc['answer'], doc['code'], doc['reasoning_steps'], doc['reflection_tokens']))
             if len(final_results) >= top_k:
                 break
@@ -527,12 +541,11 @@ class KnowledgeBaseDB:
         return final_results
 
 
-def generate_tutor_response(history, question, context):
-    """Generates a response from the LLM based on context and history."""
-    prompt = f"""You are a helpful Java 8 tutor. Your student has a question. Use the provided context to give a clear and concise answer. If the context isn't relevant, rely on your general knowledge.
+def _tutor_prompt(history, question, context):
+    return f"""You are a helpful Java 8 tutor. Your student has a question. Use the provided context to give a clear and concise answer. If the context isn't relevant, rely on your general knowledge.
 
 Conversation History:
-{history}
+{history or "(none)"}
 
 Context from Knowledge Base:
 {context}
@@ -540,48 +553,65 @@ Context from Knowledge Base:
 Student's Question: {question}
 
 Your Answer:"""
-    
-    return call_deepseek(prompt)
+
+
+def generate_tutor_response(history, question, context):
+    """Generates a response from the LLM based on context and history."""
+    return call_deepseek(_tutor_prompt(history, question, context))
+
+
+def stream_tutor_response(history, question, context, model="deepseek"):
+    """Like generate_tutor_response, but yields the answer as it is generated."""
+    produced = False
+    try:
+        for token in stream_model(model, [{"role": "user", "content": _tutor_prompt(history, question, context)}]):
+            produced = True
+            yield token
+    except ModelAPIError as e:
+        print(f"An unexpected error occurred during {model} stream: {e}")
+    if not produced:
+        yield "Sorry, an unexpected error occurred while connecting to my knowledge source."
 
 
 class CLASSRAGSystem:
     """The main RAG system for answering questions."""
     def __init__(self, session_id):
         self.session_id = session_id
-        self.history = []
+        # Last few turns verbatim plus a rolling summary, so prompts stay the same size all session
+        self.memory = ConversationMemory(session_id, db_path=SQLITE_DB_PATH)
         self.knowledge_db = KnowledgeBaseDB()
 
-    def answer_question(self, question: str) -> str:
-        # 1. Retrieve relevant context
+    def _retrieve_context(self, question):
         context_entries = self.knowledge_db.search(question, top_k=3)
-        
-        # Format context
-        context = "\n".join(
+        return "\n".join(
             f"Q: {e[0]}\nA: {e[1]}" 
             for e in context_entries
         )
+
+    def answer_question(self, question: str) -> str:
+        # 1. Retrieve relevant context
+        context = self._retrieve_context(question)
         
         # 2. Generate response
-        response = generate_tutor_response(self.history, question, context)
+        response = generate_tutor_response(self.memory.render(), question, context)
         
         # 3. Update history
-        self.history.extend([
-            {"role": "user", "content": question},
-            {"role": "assistant", "content": response}
-        ])
-        self._store_conversation(question, response)
+        self._record_turn(question, response)
         
         return response
 
-    def _store_conversation(self, question, response):
-        """Stores the conversation turn in the database."""
-        with sqlite3.connect(SQLITE_DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO conversations (session_id, user_input, system_response) VALUES (?, ?, ?)",
-                (self.session_id, question, response)
-            )
-            conn.commit()
+    def stream_answer(self, question: str):
+        """Yields the answer token by token; history is updated once the answer is complete."""
+        context = self._retrieve_context(question)
+        tokens = []
+        for token in stream_tutor_response(self.memory.render(), question, context):
+            tokens.append(token)
+            yield token
+        self._record_turn(question, "".join(tokens))
+
+    def _record_turn(self, question, response):
+        """Stores the turn in conversation_history.db and folds old turns into the summary."""
+        self.memory.add_turn(question, response)
 
 
 
@@ -591,6 +621,7 @@ if __name__ == "__main__":
     parser.add_argument('--run-pipeline', action='store_true', help='Run the full data crawling and processing pipeline.')
     parser.add_argument('--process-only', action='store_true', help='Only process raw data without crawling.')
     parser.add_argument('--chat', action='store_true', help='Start an interactive chat session.')
+    parser.add_argument('--no-stream', action='store_true', help='In chat mode, wait for the full answer instead of streaming it.')
     args = parser.parse_args()
 
     if args.run_pipeline:
@@ -684,8 +715,14 @@ if __name__ == "__main__":
             user_query = input("You: ")
             if user_query.lower() == 'exit':
                 break
-            response = rag_system.answer_question(user_query)
-            print(f"Tutor: {response}")
+            if args.no_stream:
+                response = rag_system.answer_question(user_query)
+                print(f"Tutor: {response}")
+                continue
+            print("Tutor: ", end="", flush=True)
+            for token in rag_system.stream_answer(user_query):
+                print(token, end="", flush=True)
+            print()
     else:
         print("Please specify an action: --run-pipeline or --chat")
 
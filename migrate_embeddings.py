@@ -0,0 +1,26 @@
+"""Convert knowledge_base.db embeddings from comma-separated TEXT to float32 BLOBs.
+
+Safe to run more than once: only rows still holding TEXT are rewritten.
+"""
+import argparse
+import os
+import sqlite3
+from services.embedding_store import migrate_text_embeddings
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate knowledge_base embeddings to float32 BLOBs")
+    parser.add_argument("--db", default="knowledge_base.db", help="Path to the knowledge base database")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows converted per transaction")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to return the freed space to the OS")
+    args = parser.parse_args()
+
+    before = os.path.getsize(args.db)
+    converted = migrate_text_embeddings(args.db, args.batch_size)
+    print(f"Converted {converted} embeddings to float32 BLOBs")
+    if args.vacuum:
+        with sqlite3.connect(args.db) as conn:
+            conn.execute("VACUUM")
+        print(f"Database size: {before / 1e6:.1f} MB -> {os.path.getsize(args.db) / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    main()
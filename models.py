@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, DateTime, func
+from sqlalchemy import Column, String, Text, DateTime, LargeBinary, Integer, Boolean, func
 from database import Base
 
 class RAGCache(Base):
@@ -6,4 +6,16 @@ class RAGCache(Base):
     query_hash = Column(String(32), primary_key=True)
     stage = Column(String(32), primary_key=True)
     content = Column(Text)
-    created_at = Column(DateTime, default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime, default=func.now())
+    fingerprint = Column(String(16))        # prompts + models the stage was produced with
+    last_accessed = Column(DateTime)
+    hit_count = Column(Integer, default=0)
+    compressed = Column(Boolean, default=False)  # content is base64(zlib(utf-8))
+
+class SemanticCacheEntry(Base):
+    __tablename__ = "semantic_cache"
+    query_hash = Column(String(32), primary_key=True)  # md5 of cache_key, same as RAGCache.query_hash
+    cache_key = Column(Text, nullable=False)            # query whose stages are stored in rag_cache
+    normalized = Column(Text, nullable=False, index=True)
+    embedding = Column(LargeBinary, nullable=False)     # float32, L2-normalised
+    created_at = Column(DateTime, default=func.now())
@@ -2,8 +2,10 @@ import subprocess
 import tempfile
 import os
 import re
+import time
 from fastapi import APIRouter, Request
 from core.utils import extract_class_name
+from services.metrics import CODE_EXECUTION_SECONDS
 
 router = APIRouter()
 
@@ -21,23 +23,27 @@ async def run_code(request: Request):
             with open(java_file, "w") as f:
                 f.write(code)
             
+            start = time.perf_counter()
             compile_result = subprocess.run(
                 ["javac", java_file],
                 capture_output=True,
                 text=True,
                 timeout=10
             )
+            CODE_EXECUTION_SECONDS.observe(time.perf_counter() - start, "run-code", "compile")
             
             if compile_result.returncode != 0:
                 return {"output": "", "error": compile_result.stderr.strip()}
             
             # Run compiled code
+            start = time.perf_counter()
             run_result = subprocess.run(
                 ["java", "-cp", tmp_dir, class_name],
                 capture_output=True,
                 text=True,
                 timeout=15
             )
+            CODE_EXECUTION_SECONDS.observe(time.perf_counter() - start, "run-code", "run")
             
             return {
                 "output": run_result.stdout.strip() or "No output",
@@ -59,7 +65,9 @@ async def check_syntax(request: Request):
         with open(file_path, "w") as f:
             f.write(code)
 
+        start = time.perf_counter()
         compile = subprocess.run(["javac", file_path], capture_output=True, text=True, timeout=10)
+        CODE_EXECUTION_SECONDS.observe(time.perf_counter() - start, "check-syntax", "compile")
         errors = []
         if compile.stderr:
             for line in compile.stderr.splitlines():
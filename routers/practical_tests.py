@@ -1,11 +1,13 @@
 import os
 import json
 import re
+import time
 import requests
 from datetime import datetime
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from core.config import BASE_PATH, PAIZA_API_KEY
+from services.metrics import CODE_EXECUTION_SECONDS
 
 router = APIRouter()
 
@@ -48,6 +50,7 @@ def evaluate(req: CodeRequest):
     full_source = user_class_code + "\n\n" + main_class_code
 
     # Submit to Paiza API
+    start = time.perf_counter()
     try:
         response = requests.post(
             "https://api.paiza.io/runners/create",
@@ -68,6 +71,7 @@ def evaluate(req: CodeRequest):
             ).json()
             
             if result.get("status") == "completed":
+                CODE_EXECUTION_SECONDS.observe(time.perf_counter() - start, "evaluate", "paiza")
                 return {
                     "output": result.get("stdout", "") or 
                              result.get("stderr", "") or 
@@ -1,153 +1,582 @@
+import asyncio
+import hashlib
 import json
+import re
+import time
 import traceback
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional, Callable, Tuple
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from database import get_db
-from services.cache_service import load_cache_stage_db, save_cache_stage_db
-from services.model_service import call_model
-from services.pdf_service import search_pdf_chunks
-from services.rag_pipeline import search_json_content
-from core.config import ROUTING_PROMPT, COMPRESSION_PROMPT, ANSWER_PROMPT, VERIFICATION_PROMPT, ARBITRATION_PROMPT, PDF_CHUNKS
-from core.utils import format_answers, format_verifications
+from database import get_db, SessionLocal
+from services.cache_service import stage_cache, delete_cache_stages_db
+from services.model_service import acall_model, acall_model_served, astream_model, ModelAPIError, ModelTimeoutError
+from services.pdf_service import search_pdf_chunks, search_pdf_chunks_batch
+from services.rag_pipeline import search_json_snippets, search_json_snippets_batch
+from services.context_packer import pack_snippets, interleave, fit_each, token_budget
+from services.agreement import answer_agreement
+from services.metrics import stage_timer, start_request_timings, record_timing, register_collector
+from services.semantic_cache import semantic_cache
+from services.singleflight import flight, singleflight_stats
+from services.conversation_memory import ConversationMemory
+from services.index_status import index_ready
+from core.config import (
+    ROUTING_PROMPT, COMPRESSION_PROMPT, ANSWER_PROMPT, VERIFICATION_PROMPT, ARBITRATION_PROMPT,
+    ROUTING_MODEL, COMPRESSION_MODEL, GENERATION_MODELS, VERIFICATION_MODELS, ARBITRATION_MODEL, STAGE_TIMEOUTS,
+    FAST_MODE, AGREEMENT_THRESHOLD, BATCH_ROUTING_PROMPT, BATCH_ROUTING_SIZE, BATCH_CONCURRENCY, BATCH_CONCURRENCY_MAX,
+    BATCH_MAX_QUERIES,
+)
+from core.utils import format_answers, format_verifications, truncate_to_tokens, count_tokens
 
 router = APIRouter()
 
 class ExplainRequest(BaseModel):
     user_input: str
-    history: List[Dict[str, Any]] = []
+    history: List[Dict[str, Any]] = []  # [{"role": "user"|"assistant", "content"}], used when there is no session_id
+    session_id: Optional[str] = None    # server-side memory in conversation_history.db
 
-@router.post("/ragAI")
-async def rag_ai(req: ExplainRequest, db: Session = Depends(get_db)):
+class BatchRequest(BaseModel):
+    queries: List[str]
+    concurrency: Optional[int] = None  # defaults to BATCH_CONCURRENCY, capped at BATCH_CONCURRENCY_MAX
+
+class InvalidateRequest(BaseModel):
+    user_input: Optional[str] = None  # omit to clear the whole semantic cache
+
+async def _call(model: str, messages: List[Dict[str, str]], stage: str) -> str:
+    """Call a model through the pooled async client, bounded by the stage timeout.
+
+    Raises ModelAPIError (ModelTimeoutError past the deadline).
+    """
     try:
-        query = req.user_input.strip()
-        if not query:
-            raise HTTPException(status_code=400, detail="Query cannot be empty")
+        return await asyncio.wait_for(acall_model(model, messages), timeout=STAGE_TIMEOUTS[stage])
+    except asyncio.TimeoutError:
+        print(f"[TIMEOUT] {stage} call to {model} exceeded {STAGE_TIMEOUTS[stage]}s")
+        raise ModelTimeoutError(model, f"{stage} timed out after {STAGE_TIMEOUTS[stage]}s")
+
+async def _fan_out(models: List[str], build_messages: Callable[[str], List[Dict[str, str]]],
+                   stage: str) -> Tuple[List[Dict[str, str]], List[str]]:
+    """Send every model its prompt at once and keep whatever answers arrive in time.
+
+    ``build_messages(model)`` builds each model's prompt, so context can be packed to
+    that deployment's token budget. Returns the successful ``{"model", "requested", "response"}``
+    results in model order, where ``model`` is the deployment that actually answered
+    (a hedge or failover may stand in for the requested one), plus the requested
+    models that failed or missed the stage deadline.
+    """
+    tasks = [asyncio.create_task(acall_model_served(model, build_messages(model))) for model in models]
+    done, pending = await asyncio.wait(tasks, timeout=STAGE_TIMEOUTS[stage])
+    for task in pending:
+        task.cancel()
+
+    results, failed = [], []
+    for model, task in zip(models, tasks):
+        if task in done and task.exception() is None:
+            response, served_by = task.result()
+            results.append({"model": served_by, "requested": model, "response": response})
+        else:
+            reason = "timed out" if task in pending else "failed"
+            print(f"[{stage.upper()}] {model} {reason}, continuing without it")
+            failed.append(model)
+    return results, failed
+
+async def _route(query: str, cache_key: str) -> str:
+    try:
+        with stage_timer("routing"):
+            routing_result = await _call(ROUTING_MODEL, [
+                {"role": "system", "content": ROUTING_PROMPT},
+                {"role": "user", "content": query}
+            ], "routing")
+    except ModelAPIError:
+        return "both"  # Router unavailable; search everything, don't cache
+    
+    # Validate routing result
+    routing_result = routing_result.lower()
+    if "pdf" not in routing_result and "json" not in routing_result:
+        routing_result = "both"  # Default fallback
+    stage_cache.put(cache_key, "routing", routing_result)
+    return routing_result
+
+async def _retrieve_pdf(query: str, cache_key: str) -> Tuple[str, List[Dict[str, Any]]]:
+    with stage_timer("pdf_retrieval"):
+        pdf_context, pdf_matches_list = await asyncio.to_thread(search_pdf_chunks, query)
+    stage_cache.put(cache_key, "pdf_context", pdf_context)
+    stage_cache.put(cache_key, "pdf_matches", json.dumps(pdf_matches_list))
+    return pdf_context, pdf_matches_list
+
+async def _retrieve_json(query: str, cache_key: str) -> List[str]:
+    with stage_timer("json_retrieval"):
+        json_snippets = await asyncio.to_thread(search_json_snippets, query)
+    stage_cache.put(cache_key, "json_context", json.dumps(json_snippets))
+    return json_snippets
+
+async def _compress(query: str, cache_key: str, context: str, cacheable: bool = True) -> str:
+    """Compress ``context``; cached only when ``cacheable``, i.e. every routed source was searched."""
+    try:
+        with stage_timer("compression"):
+            narrowed = await _call(COMPRESSION_MODEL, [
+                {"role": "system", "content": COMPRESSION_PROMPT},
+                {"role": "user", "content": f"Query: {query}\nContext:\n{context}"}
+            ], "compression")
+    except ModelAPIError:
+        # Fall back to the raw context rather than compressing nothing
+        return context
+    if cacheable:
+        stage_cache.put(cache_key, "narrowed", narrowed)
+    return narrowed
+
+def _stage(step: int, name: str) -> Dict[str, Any]:
+    return {"event": "stage", "step": step, "total": 6, "stage": name}
+
+async def _rag_events(query: str, db: Session, stream: bool = False, conversation: str = "") -> AsyncIterator[Dict[str, Any]]:
+    """Run the six-stage pipeline, yielding progress events as it goes.
+
+    Events are ``stage`` (a step is starting), ``token`` (a piece of the final
+    answer, only when ``stream`` is set) and a closing ``result`` carrying the
+    same payload ``/ragAI`` returns. ``conversation`` is the rendered session
+    memory; answers that depend on it are neither read from nor written to the
+    final-result caches, while retrieval and compression are still shared.
+    """
+    debug_log = {"query": query, "timestamp": datetime.now().isoformat()}
+    if conversation:
+        debug_log["conversation_tokens"] = count_tokens(conversation)
+    cache_key = query  # Using query as key for caching
+    query_embedding = None
+    timings = start_request_timings()
+    started = time.perf_counter()
+
+    # Check for cached final result first, then for a paraphrase of an answered query
+    with stage_timer("cache_lookup"):
+        stages = stage_cache.load(cache_key, db)
+    final_result = None if conversation else stages.get("final_result")
+    if not final_result and not conversation:
+        with stage_timer("semantic_lookup"):
+            match = await semantic_cache.lookup(query, db)
+        query_embedding = match["embedding"]
+        if match["cache_key"]:
+            cache_key = match["cache_key"]
+            debug_log["semantic_cache"] = {"matched_query": cache_key, "similarity": round(match["similarity"], 4)}
+            print(f"[SEMANTIC CACHE] {query[:20]}... -> {cache_key[:20]}... ({match['similarity']:.3f})")
+            stages = stage_cache.load(cache_key, db)
+            final_result = stages.get("final_result")
+    if final_result:
+        print(f"[CACHE] Loaded final result for: {query[:20]}...")
+        result = json.loads(final_result)
+        result["debug_log"] = {**result["debug_log"], "timings": timings}
+        if "semantic_cache" in debug_log:
+            result["debug_log"]["semantic_cache"] = debug_log["semantic_cache"]
+        if stream:
+            yield {"event": "token", "data": result["final_answer"]}
+        yield {"event": "result", "data": result}
+        return
+
+    # Intermediate stages (all fetched by the single lookup above)
+    routing_result = stages.get("routing")
+    pdf_context = stages.get("pdf_context")
+    pdf_matches = stages.get("pdf_matches")
+    json_context = stages.get("json_context")
+    narrowed = stages.get("narrowed")
+    
+    # Convert stored matches and snippets if available
+    pdf_matches_list = []
+    if pdf_matches:
+        try:
+            pdf_matches_list = json.loads(pdf_matches)
+        except:
+            pdf_matches_list = []
+    json_snippets = []
+    if json_context:
+        try:
+            json_snippets = json.loads(json_context)
+        except:
+            json_snippets = []
+
+    # If all stages are cached
+    if routing_result and pdf_context and pdf_matches and json_context and narrowed:
+        print(f"[CACHE] Loaded all stages for: {query[:20]}...")
+    else:
+        # Step 1: Routing
+        if not routing_result:
+            print(f"[1/6] Routing query: {query[:30]}...")
+            yield _stage(1, "routing")
+            routing_result = await flight("routing").do(cache_key, lambda: _route(query, cache_key))
+        debug_log["routing"] = routing_result
+
+        # Step 2: Context Retrieval
+        yield _stage(2, "retrieval")
+        unready = [name for name in ("pdf", "json") if name in routing_result and not index_ready(name)]
+        if unready:
+            # Still building after a restart: answer from whatever is ready, and cache neither the
+            # compressed context nor the result, so the next run searches the missing sources
+            debug_log["degraded"] = unready
+        if "pdf" in routing_result and "pdf" not in unready and (not pdf_context or not pdf_matches):
+            print(f"[2/6] Retrieving PDF context: {query[:30]}...")
+            pdf_context, pdf_matches_list = await flight("pdf_retrieval").do(cache_key, lambda: _retrieve_pdf(query, cache_key))
         
-        debug_log = {"query": query, "timestamp": datetime.now().isoformat()}
-        cache_key = query  # Using query as key for caching
-
-        # Check for cached final result first
-        if final_result := load_cache_stage_db(cache_key, "final_result", db):
-            print(f"[CACHE] Loaded final result for: {query[:20]}...")
-            return json.loads(final_result)
-
-        # Load intermediate stages
-        routing_result = load_cache_stage_db(cache_key, "routing", db)
-        pdf_context = load_cache_stage_db(cache_key, "pdf_context", db)
-        pdf_matches = load_cache_stage_db(cache_key, "pdf_matches", db)
-        json_context = load_cache_stage_db(cache_key, "json_context", db)
-        narrowed = load_cache_stage_db(cache_key, "narrowed", db)
+        if "json" in routing_result and "json" not in unready and not json_context:
+            print(f"[2/6] Retrieving JSON context: {query[:30]}...")
+            json_snippets = await flight("json_retrieval").do(cache_key, lambda: _retrieve_json(query, cache_key))
         
-        # Convert stored matches if available
-        pdf_matches_list = []
-        if pdf_matches:
-            try:
-                pdf_matches_list = json.loads(pdf_matches)
-            except:
-                pdf_matches_list = []
+        # Combine contexts based on routing: whole ranked snippets, both sources interleaved, up to the token budget
+        pdf_snippets = [f"File: {m['file']}, Page {m['page']}:\n{m['snippet']}" for m in pdf_matches_list] if "pdf" in routing_result else []
+        context = pack_snippets(interleave(pdf_snippets, json_snippets if "json" in routing_result else []),
+                                token_budget("compression", COMPRESSION_MODEL)) or "No relevant context found"
+        
+        # Step 3: Context Compression
+        if not narrowed:
+            print(f"[3/6] Compressing context: {query[:30]}...")
+            yield _stage(3, "compression")
+            # A degraded run's compression is neither cached nor shared with a run that searched every source
+            flight_key = f"{cache_key}\x00{','.join(unready)}" if unready else cache_key
+            narrowed = await flight("compression").do(flight_key, lambda: _compress(query, cache_key, context, not unready))
+        debug_log["compressed_context"] = narrowed[:500] + "..." if len(narrowed) > 500 else narrowed
 
-        # If all stages are cached
-        if routing_result and pdf_context and pdf_matches and json_context and narrowed:
-            print(f"[CACHE] Loaded all stages for: {query[:20]}...")
-        else:
-            # Step 1: Routing
-            if not routing_result:
-                print(f"[1/6] Routing query: {query[:30]}...")
-                routing_result = call_model("gpt-5-mini", [
-                    {"role": "system", "content": ROUTING_PROMPT},
-                    {"role": "user", "content": query}
-                ]).lower()
-                
-                # Validate routing result
-                if "pdf" not in routing_result and "json" not in routing_result:
-                    routing_result = "both"  # Default fallback
-                    
-                save_cache_stage_db(cache_key, "routing", routing_result, db)
-            debug_log["routing"] = routing_result
-
-            # Step 2: Context Retrieval
-            if "pdf" in routing_result and (not pdf_context or not pdf_matches):
-                print(f"[2/6] Retrieving PDF context: {query[:30]}...")
-                pdf_context, pdf_matches_list = search_pdf_chunks(PDF_CHUNKS, query)
-                save_cache_stage_db(cache_key, "pdf_context", pdf_context, db)
-                save_cache_stage_db(cache_key, "pdf_matches", json.dumps(pdf_matches_list), db)
-            
-            if "json" in routing_result and not json_context:
-                print(f"[2/6] Retrieving JSON context: {query[:30]}...")
-                json_context = search_json_content(query)
-                save_cache_stage_db(cache_key, "json_context", json_context, db)
-            
-            # Combine contexts based on routing
-            context = ""
-            if "pdf" in routing_result and "json" in routing_result:
-                context = f"PDF CONTEXT:\n{pdf_context}\n\nJSON CONTEXT:\n{json_context}"
-            elif "pdf" in routing_result:
-                context = pdf_context
-            elif "json" in routing_result:
-                context = json_context
-            else:
-                context = "No relevant context found"
-            
-            # Step 3: Context Compression
-            if not narrowed:
-                print(f"[3/6] Compressing context: {query[:30]}...")
-                narrowed = call_model("gpt-5-mini", [
-                    {"role": "system", "content": COMPRESSION_PROMPT},
-                    {"role": "user", "content": f"Query: {query}\nContext:\n{context[:6000]}"}
-                ])
-                save_cache_stage_db(cache_key, "narrowed", narrowed, db)
-            debug_log["compressed_context"] = narrowed[:500] + "..." if len(narrowed) > 500 else narrowed
-
-        # Populate debug log
-        debug_log["pdf_matches"] = pdf_matches_list[:3] if pdf_matches_list else []
-        debug_log["json_context"] = json_context[:300] + "..." if json_context else ""
-
-        # Step 4: Answer Generation
-        print(f"[4/6] Generating answers: {query[:30]}...")
-        gen_models = ["gpt-5", "gpt-5-mini"]
-        answers = []
-        for model in gen_models:
-            response = call_model(model, [
-                {"role": "system", "content": ANSWER_PROMPT},
-                {"role": "user", "content": f"Query: {query}\nRelevant Context:\n{narrowed[:4000]}"}
-            ])
-            answers.append({"model": model, "answer": response})
-        debug_log["generated_answers"] = [{"model": a["model"], "summary": a["answer"][:100]} for a in answers]
-
-        # Step 5: Answer Verification
+    # Populate debug log
+    debug_log["pdf_matches"] = pdf_matches_list[:3] if pdf_matches_list else []
+    debug_log["json_context"] = "\n\n".join(json_snippets)[:300] + "..." if json_snippets else ""
+
+    # Step 4: Answer Generation (all models in parallel)
+    print(f"[4/6] Generating answers: {query[:30]}...")
+    yield _stage(4, "generation")
+    with stage_timer("generation"):
+        generated, failed_gen = await _fan_out(GENERATION_MODELS, lambda model: [
+            {"role": "system", "content": ANSWER_PROMPT},
+            {"role": "user", "content": (f"Conversation so far:\n{conversation}\n\n" if conversation else "") +
+                                        f"Query: {query}\nRelevant Context:\n{truncate_to_tokens(narrowed, token_budget('generation', model))}"}
+        ], "generation")
+    if not generated:
+        raise HTTPException(status_code=504, detail="No model produced an answer in time")
+    answers = [{"model": g["model"], "answer": g["response"]} for g in generated]
+    stand_ins = {f"generation:{g['requested']}": g["model"] for g in generated if g["model"] != g["requested"]}
+    debug_log["generated_answers"] = [{"model": a["model"], "summary": a["answer"][:100]} for a in answers]
+
+    # Fast mode: measure agreement and decide how much checking the answers need
+    mode = "full"
+    # Answers from one deployment standing in for another are not independent, so agreement proves nothing
+    if FAST_MODE != "off" and len({a["model"] for a in answers}) > 1:
+        with stage_timer("agreement"):
+            agreement, method = await answer_agreement([a["answer"] for a in answers])
+        debug_log["agreement"] = {"score": round(agreement, 4), "method": method, "threshold": AGREEMENT_THRESHOLD}
+        if agreement >= AGREEMENT_THRESHOLD:
+            mode = FAST_MODE
+    debug_log["mode"] = mode
+
+    # Step 5: Answer Verification (all models in parallel)
+    formatted_answers = format_answers(answers)
+
+    def answers_within(budget: int) -> str:
+        # Every model's answer keeps an equal share instead of the first one crowding out the rest
+        return format_answers([{"model": a["model"], "answer": text}
+                               for a, text in zip(answers, fit_each([a["answer"] for a in answers], budget))])
+    verifications, failed_ver = [], []
+    if mode != "skip":
         print(f"[5/6] Verifying answers: {query[:30]}...")
-        ver_models = ["gpt-5", "gpt-5-mini"]
-        formatted_answers = format_answers(answers)
-        verifications = []
-        for model in ver_models:
-            verdict = call_model(model, [
+        yield _stage(5, "verification")
+        with stage_timer("verification"):
+            verified, failed_ver = await _fan_out(VERIFICATION_MODELS[:1] if mode == "single" else VERIFICATION_MODELS, lambda model: [
                 {"role": "system", "content": VERIFICATION_PROMPT},
-                {"role": "user", "content": f"Query: {query}\nContext:\n{narrowed[:3000]}\n\nAnswers:\n{formatted_answers[:2000]}"}
-            ])
-            verifications.append({"model": model, "verification": verdict})
+                {"role": "user", "content": f"Query: {query}\n"
+                                            f"Context:\n{truncate_to_tokens(narrowed, token_budget('verification_context', model))}\n\n"
+                                            f"Answers:\n{answers_within(token_budget('verification_answers', model))}"}
+            ], "verification")
+        verifications = [{"model": v["model"], "verification": v["response"]} for v in verified]
+        stand_ins.update({f"verification:{v['requested']}": v["model"] for v in verified if v["model"] != v["requested"]})
         debug_log["verifications"] = [{"model": v["model"], "summary": v["verification"][:100]} for v in verifications]
+    if stand_ins:
+        debug_log["served_by"] = stand_ins  # "stage:requested model" -> the hedge or failover deployment that answered
+    if failed_gen or failed_ver:
+        debug_log["skipped_models"] = {"generation": failed_gen, "verification": failed_ver}
 
-        # Step 6: Final Arbitration
+    # Step 6: Final Arbitration
+    if mode == "skip":
+        # The answers already agree; the primary generator's answer stands as the final one
+        print(f"[6/6] Answers agree, skipping verification and arbitration: {query[:30]}...")
+        final = answers[0]["answer"]
+        if stream:
+            yield {"event": "token", "data": final}
+    else:
         print(f"[6/6] Final arbitration: {query[:30]}...")
-        arb_input = f"## Answers\n{formatted_answers[:3000]}\n\n## Verifications\n{format_verifications(verifications)[:2000]}"
-        final = call_model("gpt-5-mini", [
+        yield _stage(6, "arbitration")
+        verification_texts = fit_each([v["verification"] for v in verifications],
+                                      token_budget("arbitration_verifications", ARBITRATION_MODEL))
+        arb_input = (f"## Answers\n{answers_within(token_budget('arbitration_answers', ARBITRATION_MODEL))}\n\n"
+                     f"## Verifications\n{format_verifications([{'model': v['model'], 'verification': t} for v, t in zip(verifications, verification_texts)])}")
+        arb_messages = [
             {"role": "system", "content": ARBITRATION_PROMPT},
             {"role": "user", "content": arb_input}
-        ])
-        debug_log["final_answer"] = final
+        ]
+        final, tokens = None, []
+        try:
+            with stage_timer("arbitration"):
+                if stream:
+                    async for token in astream_model(ARBITRATION_MODEL, arb_messages):
+                        tokens.append(token)
+                        yield {"event": "token", "data": token}
+                    final = "".join(tokens) or None
+                else:
+                    final = await _call(ARBITRATION_MODEL, arb_messages, "arbitration")
+        except ModelAPIError as e:
+            debug_log["arbitration_error"] = str(e)
+            if tokens:
+                # The client already has part of the answer; keep it but don't cache it
+                final = "".join(tokens)
+                debug_log["arbitration_truncated"] = True
+        if final is None:
+            # Arbitration failed; the first generated answer is still better than nothing
+            final = answers[0]["answer"]
+            debug_log["arbitration_fallback"] = True
+            if stream:
+                yield {"event": "token", "data": final}
+    debug_log["final_answer"] = final
+    record_timing("total", time.perf_counter() - started)
+    debug_log["timings"] = timings
 
-        # Prepare and cache result
-        result = {"final_answer": final, "debug_log": debug_log}
-        save_cache_stage_db(cache_key, "final_result", json.dumps(result), db)
-        
+    # Prepare and cache result
+    result = {"final_answer": final, "debug_log": debug_log}
+    # Only cache complete runs so a degraded answer is not served forever
+    complete = not (failed_gen or failed_ver or debug_log.get("degraded")
+                    or debug_log.get("arbitration_fallback") or debug_log.get("arbitration_truncated"))
+    if complete and not conversation:
+        stage_cache.put(cache_key, "final_result", json.dumps(result))
+    stage_cache.flush(db)  # one commit for every stage this request produced
+    if complete and cache_key == query and not conversation:
+        await semantic_cache.add(query, db, query_embedding)
+    
+    yield {"event": "result", "data": result}
+
+async def _run_pipeline(query: str, conversation: str = "") -> Dict[str, Any]:
+    # Shared by coalesced requests, so it owns its session rather than borrowing one request's
+    db = SessionLocal()
+    try:
+        async for event in _rag_events(query, db, conversation=conversation):
+            if event["event"] == "result":
+                return event["data"]
+    finally:
+        db.close()
+
+async def _conversation_memory(req: ExplainRequest) -> Optional[ConversationMemory]:
+    if req.session_id:
+        return await asyncio.to_thread(ConversationMemory, req.session_id)
+    if req.history:
+        return ConversationMemory.from_history(req.history)
+    return None
+
+_memory_tasks = set()
+
+def _remember_turn(memory: ConversationMemory, query: str, answer: str):
+    """Store the turn in the background: folding may call the summary model, and the answer is already done."""
+    task = asyncio.ensure_future(asyncio.to_thread(memory.add_turn, query, answer))
+    _memory_tasks.add(task)
+    task.add_done_callback(_memory_tasks.discard)
+
+@router.post("/ragAI")
+async def rag_ai(req: ExplainRequest):
+    try:
+        query = req.user_input.strip()
+        if not query:
+            raise HTTPException(status_code=400, detail="Query cannot be empty")
+        memory = await _conversation_memory(req)
+        conversation = memory.render() if memory else ""
+        # Identical questions (in the same conversation state) arriving together share one pipeline run
+        key = f"{query}\x00{hashlib.md5(conversation.encode()).hexdigest()}" if conversation else query
+        result = await flight("pipeline").do(key, lambda: _run_pipeline(query, conversation))
+        if req.session_id:
+            _remember_turn(memory, query, result["final_answer"])
         return result
 
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(
             status_code=500, 
             detail=f"RAG processing failed: {str(e)}"
         )
+
+def _sse(event: Dict[str, Any]) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+_ROUTE_LINE = re.compile(r"^\s*(\d+)\s*[:.)\-]\s*(.+)$")
+
+def _parse_batch_routing(response: str, count: int) -> Dict[int, str]:
+    """``{position: route}`` from "<number>: <route>" lines; unparseable lines are ignored."""
+    routes = {}
+    for line in response.splitlines():
+        m = _ROUTE_LINE.match(line)
+        if m and 1 <= int(m.group(1)) <= count:
+            route = m.group(2).strip().lower()
+            routes[int(m.group(1)) - 1] = route if "pdf" in route or "json" in route else "both"
+    return routes
+
+async def _route_batch(queries: List[str]) -> Dict[str, str]:
+    """Route many queries with one multi-query call per BATCH_ROUTING_SIZE of them.
+
+    Queries the router leaves unlabelled are missing from the result; the pipeline
+    routes those one by one as usual.
+    """
+    chunks = [queries[i:i + BATCH_ROUTING_SIZE] for i in range(0, len(queries), BATCH_ROUTING_SIZE)]
+    with stage_timer("batch_routing"):
+        responses = await asyncio.gather(*[_call(ROUTING_MODEL, [
+            {"role": "system", "content": BATCH_ROUTING_PROMPT},
+            {"role": "user", "content": "\n".join(f"{i}. {q}" for i, q in enumerate(chunk, 1))}
+        ], "routing") for chunk in chunks], return_exceptions=True)
+
+    routes = {}
+    for chunk, response in zip(chunks, responses):
+        if isinstance(response, ModelAPIError):
+            continue
+        if isinstance(response, BaseException):
+            raise response
+        for position, route in _parse_batch_routing(response, len(chunk)).items():
+            routes[chunk[position]] = route
+            stage_cache.put(chunk[position], "routing", route)
+    return routes
+
+async def _retrieve_batch(routes: Dict[str, str], stages: Dict[str, Dict[str, str]]):
+    """Fill the retrieval stages of every routed query at once: one BM25F product, one index thread for the PDFs."""
+    pdf_queries = [q for q, r in routes.items() if "pdf" in r and index_ready("pdf") and not (stages[q].get("pdf_context") and stages[q].get("pdf_matches"))]
+    json_queries = [q for q, r in routes.items() if "json" in r and index_ready("json") and not stages[q].get("json_context")]
+    with stage_timer("batch_retrieval"):
+        pdf_results, json_results = await asyncio.gather(
+            asyncio.to_thread(search_pdf_chunks_batch, pdf_queries),
+            asyncio.to_thread(search_json_snippets_batch, json_queries),
+        )
+    for query, (pdf_context, pdf_matches_list) in zip(pdf_queries, pdf_results):
+        stage_cache.put(query, "pdf_context", pdf_context)
+        stage_cache.put(query, "pdf_matches", json.dumps(pdf_matches_list))
+    for query, json_snippets in zip(json_queries, json_results):
+        stage_cache.put(query, "json_context", json.dumps(json_snippets))
+
+@router.post("/ragAI/batch")
+async def rag_ai_batch(req: BatchRequest):
+    """Answer many queries, streaming one server-sent ``result`` (or ``error``) event per query as it finishes.
+
+    Duplicates run once and cached answers are returned first. Routing and retrieval
+    are batched across all remaining queries before the per-query stages run with
+    bounded concurrency. Events carry the query's ``index`` in the request.
+    """
+    positions: Dict[str, List[int]] = {}
+    for index, query in enumerate(req.queries):
+        positions.setdefault(query.strip(), []).append(index)
+    empty = positions.pop("", [])
+    if not positions:
+        raise HTTPException(status_code=400, detail="No non-empty queries")
+    if len(positions) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUERIES} distinct queries per batch")
+    concurrency = max(1, min(req.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY_MAX))
+
+    async def answer(query: str, semaphore: asyncio.Semaphore) -> Tuple[str, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        async with semaphore:
+            try:
+                return query, await flight("pipeline").do(query, lambda: _run_pipeline(query)), None
+            except HTTPException as e:
+                return query, None, {"status": e.status_code, "detail": e.detail}
+            except Exception as e:
+                traceback.print_exc()
+                return query, None, {"status": 500, "detail": f"RAG processing failed: {str(e)}"}
+
+    async def events():
+        db = SessionLocal()
+        counts = {"cached": 0, "answered": 0, "failed": len(empty)}
+        try:
+            for index in empty:
+                yield _sse({"event": "error", "index": index, "query": "", "status": 400, "detail": "Query cannot be empty"})
+
+            # Answers that already exist go out straight away
+            stages, pending = {}, []
+            for query in positions:
+                stages[query] = stage_cache.load(query, db)
+                final_result = stages[query].get("final_result")
+                if final_result:
+                    counts["cached"] += 1
+                    for index in positions[query]:
+                        yield _sse({"event": "result", "index": index, "query": query, "cached": True,
+                                    "data": json.loads(final_result)})
+                else:
+                    pending.append(query)
+            print(f"[BATCH] {len(req.queries)} queries: {len(positions)} distinct, {counts['cached']} cached, {len(pending)} to run")
+
+            # Batched routing and retrieval; the pipeline then finds these stages in the cache
+            routes = {q: stages[q]["routing"] for q in pending if stages[q].get("routing")}
+            unrouted = [q for q in pending if q not in routes]
+            if unrouted:
+                routes.update(await _route_batch(unrouted))
+            if routes:
+                await _retrieve_batch(routes, stages)
+
+            semaphore = asyncio.Semaphore(concurrency)
+            for finished in asyncio.as_completed([answer(q, semaphore) for q in pending]):
+                query, result, error = await finished
+                counts["failed" if error else "answered"] += 1
+                for index in positions[query]:
+                    if error:
+                        yield _sse({"event": "error", "index": index, "query": query, **error})
+                    else:
+                        yield _sse({"event": "result", "index": index, "query": query, "cached": False, "data": result})
+            stage_cache.flush(db)
+            yield _sse({"event": "done", "total": len(req.queries), **counts})
+        finally:
+            db.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.post("/ragAI/stream")
+async def rag_ai_stream(req: ExplainRequest):
+    """Server-sent events version of /ragAI: stage progress, then the answer token by token."""
+    query = req.user_input.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    async def events():
+        # The session must outlive the handler, so the stream owns it instead of get_db
+        db = SessionLocal()
+        try:
+            memory = await _conversation_memory(req)
+            async for event in _rag_events(query, db, stream=True, conversation=memory.render() if memory else ""):
+                if event["event"] == "result" and req.session_id:
+                    _remember_turn(memory, query, event["data"]["final_answer"])
+                yield _sse(event)
+        except HTTPException as e:
+            yield _sse({"event": "error", "status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            traceback.print_exc()
+            yield _sse({"event": "error", "status": 500, "detail": f"RAG processing failed: {str(e)}"})
+        finally:
+            db.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+register_collector(
+    "rag_singleflight_total", "Single-flight leaders and coalesced waiters per group", ("group", "role"),
+    lambda: {(g, role): st[role] for g, st in singleflight_stats().items() for role in ("leaders", "coalesced")},
+    "counter",
+)
+register_collector(
+    "rag_cache_lookups_total", "Cache lookups per tier and outcome", ("tier", "outcome"),
+    lambda: {
+        ("memory", "hit"): stage_cache.stats["memory_hits"],
+        ("sqlite", "hit"): stage_cache.stats["db_hits"],
+        ("sqlite", "miss"): stage_cache.stats["misses"],
+        ("semantic", "exact_hit"): semantic_cache.stats["exact_hits"],
+        ("semantic", "hit"): semantic_cache.stats["semantic_hits"],
+        ("semantic", "miss"): semantic_cache.stats["misses"],
+    },
+    "counter",
+)
+
+@router.get("/ragAI/cache/stats")
+def cache_stats():
+    return {"semantic": semantic_cache.get_stats(), "stages": stage_cache.get_stats(),
+            "singleflight": singleflight_stats()}
+
+@router.post("/ragAI/cache/invalidate")
+def cache_invalidate(req: InvalidateRequest, db: Session = Depends(get_db)):
+    """Forget a cached answer (and every paraphrase pointing at it), or all of them."""
+    removed = semantic_cache.invalidate(db, req.user_input)
+    if req.user_input and not removed:
+        removed = [req.user_input.strip()]
+    stages = sum(delete_cache_stages_db(key, db) for key in removed)
+    return {"removed_queries": len(removed), "removed_stages": stages}
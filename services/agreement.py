@@ -0,0 +1,34 @@
+import re
+from itertools import combinations
+from typing import List, Tuple
+import numpy as np
+from services.model_service import acall_embedding_model
+from core.config import AGREEMENT_METHOD, AGREEMENT_MODEL
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"[a-z0-9_]+", text.lower())
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+def overlap_agreement(answers: List[str]) -> float:
+    """Lowest pairwise Dice overlap of word unigrams + bigrams (1.0 = same wording)."""
+    sets = [_shingles(a) for a in answers]
+    scores = [2 * len(a & b) / (len(a) + len(b)) if a or b else 1.0 for a, b in combinations(sets, 2)]
+    return min(scores) if scores else 1.0
+
+async def embedding_agreement(answers: List[str], model: str = AGREEMENT_MODEL) -> float:
+    """Lowest pairwise cosine similarity of the answers' embeddings, or -1 if embedding failed."""
+    vectors = await acall_embedding_model(model, answers)
+    if len(vectors) != len(answers):
+        return -1.0
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    sims = matrix @ matrix.T
+    return float(min(sims[i, j] for i, j in combinations(range(len(answers)), 2)))
+
+async def answer_agreement(answers: List[str], method: str = AGREEMENT_METHOD) -> Tuple[float, str]:
+    """How much the generated answers agree, and which method measured it."""
+    if method == "embedding":
+        score = await embedding_agreement(answers)
+        if score >= 0:
+            return score, "embedding"
+    return overlap_agreement(answers), "overlap"
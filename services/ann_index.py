@@ -0,0 +1,94 @@
+import hashlib
+import os
+from typing import Optional
+import numpy as np
+from services.ranking import top_k
+
+def matrix_fingerprint(vectors: np.ndarray, n_lists: int) -> str:
+    digest = hashlib.sha256(f"{vectors.shape}|{n_lists}|".encode())
+    digest.update(np.ascontiguousarray(vectors, dtype=np.float32).data)
+    return digest.hexdigest()
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    # Chunked so the (vectors, lists) similarity matrix never has to exist in full
+    return np.concatenate([np.argmax(vectors[i:i + chunk] @ centroids.T, axis=1)
+                           for i in range(0, len(vectors), chunk)])
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbour index over unit-length vectors, in pure NumPy.
+
+    Spherical k-means splits the vectors into ``n_lists`` lists; a query scores
+    the centroids and then only the members of its ``nprobe`` closest lists.
+    More lists make each probe cheaper, more probes raise recall. The lists are
+    stored CSR-style: ``rows`` sorted by list, with ``offsets`` into it.
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, rows: np.ndarray, fingerprint: str = ""):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, n_lists: int, iterations: int = 10, seed: int = 0,
+              sample_per_list: int = 64) -> "IVFIndex":
+        rng = np.random.default_rng(seed)
+        n_lists = max(1, min(n_lists, len(vectors)))
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), n_lists * sample_per_list), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assign = _nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=n_lists)
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]  # re-seed lists that lost every member
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = (sums / np.where(norms > 0, norms, 1)).astype(np.float32)
+
+        assign = _nearest(vectors, centroids)
+        rows = np.argsort(assign, kind="stable").astype(np.int32)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))]).astype(np.int64)
+        return cls(centroids, offsets, rows)
+
+    def search(self, vectors: np.ndarray, query: np.ndarray, k: int, nprobe: int) -> np.ndarray:
+        """Positions in ``vectors`` of the (approximately) ``k`` most similar to the unit-length ``query``."""
+        probe = top_k(self.centroids @ query, nprobe)
+        candidates = np.concatenate([self.rows[self.offsets[p]:self.offsets[p + 1]] for p in probe])
+        return candidates[top_k(vectors[candidates] @ query, k)]
+
+    def save(self, path: str):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, centroids=self.centroids, offsets=self.offsets, rows=self.rows,
+                 fingerprint=np.array(self.fingerprint))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, fingerprint: str) -> Optional["IVFIndex"]:
+        """The index saved at ``path`` if it was built for ``fingerprint``, else None."""
+        try:
+            with np.load(path) as data:
+                if str(data["fingerprint"]) != fingerprint:
+                    return None
+                return cls(data["centroids"], data["offsets"], data["rows"], fingerprint)
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+def load_or_build_ivf(vectors: np.ndarray, path: str, n_lists: int) -> IVFIndex:
+    """The IVF index for ``vectors``, reused from ``path`` while the vectors are unchanged."""
+    fingerprint = matrix_fingerprint(vectors, n_lists)
+    index = IVFIndex.load(path, fingerprint)
+    if index is not None:
+        print(f"Loaded IVF index with {n_lists} lists from {path}")
+        return index
+    index = IVFIndex.build(vectors, n_lists)
+    index.fingerprint = fingerprint
+    try:
+        index.save(path)
+    except OSError as e:
+        print(f"Could not save IVF index: {e}")
+    print(f"Built IVF index over {len(vectors)} embeddings with {n_lists} lists")
+    return index
@@ -0,0 +1,124 @@
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+from services.pdf_index import tokenize
+from core.config import JSON_FIELD_WEIGHTS, JSON_FIELD_B, BM25F_K1
+
+FIELDS = ("question", "title", "answer", "content", "code")
+
+def entry_fields(entry: Dict[str, Any]) -> Dict[str, str]:
+    """The indexed text of an entry by field; entries of another shape index their string values as content."""
+    fields = {f: str(entry[f]) for f in FIELDS if entry.get(f)}
+    if not fields and isinstance(entry, dict):
+        fields["content"] = " ".join(str(v) for v in entry.values() if isinstance(v, str))
+    return fields
+
+def index_params() -> Dict[str, Any]:
+    return {"kind": "bm25f", "weights": JSON_FIELD_WEIGHTS, "b": JSON_FIELD_B, "k1": BM25F_K1}
+
+def _field_counts(entries: List[Dict[str, Any]], vocabulary: Dict[str, int]) -> Tuple[np.ndarray, ...]:
+    """Per (term, entry, field) counts plus per-field lengths; new terms are added to ``vocabulary``."""
+    term_ids, doc_ids, field_ids, counts = [], [], [], []
+    lengths = np.zeros((len(entries), len(FIELDS)), dtype=np.float32)
+    for doc, entry in enumerate(entries):
+        for field, text in entry_fields(entry).items():
+            f = FIELDS.index(field)
+            tf: Dict[str, int] = {}
+            for term in tokenize(text):
+                tf[term] = tf.get(term, 0) + 1
+            lengths[doc, f] = sum(tf.values())
+            for term, count in tf.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(doc)
+                field_ids.append(f)
+                counts.append(count)
+    return (np.asarray(term_ids, dtype=np.int32), np.asarray(doc_ids, dtype=np.int32),
+            np.asarray(field_ids, dtype=np.int32), np.asarray(counts, dtype=np.float32), lengths)
+
+def _pseudo_tf(counts: Tuple[np.ndarray, ...], avg_len: np.ndarray, n_terms: int) -> csr_matrix:
+    """(terms, entries) BM25F pseudo term frequencies: per-field normalised counts, weighted and summed."""
+    term_ids, doc_ids, field_ids, tf, lengths = counts
+    field_w = np.array([JSON_FIELD_WEIGHTS.get(f, 1.0) for f in FIELDS], dtype=np.float32)
+    field_b = np.array([JSON_FIELD_B.get(f, 0.75) for f in FIELDS], dtype=np.float32)
+    norm = 1 - field_b[field_ids] + field_b[field_ids] * lengths[doc_ids, field_ids] / avg_len[field_ids]
+    # coo -> csr sums the duplicate (term, entry) cells, i.e. the per-field contributions
+    return coo_matrix((field_w[field_ids] * tf / norm, (term_ids, doc_ids)), shape=(n_terms, len(lengths))).tocsr()
+
+def _saturate(pseudo_tf: csr_matrix, idf: np.ndarray, k1: float) -> csr_matrix:
+    rows = np.repeat(np.arange(pseudo_tf.shape[0]), np.diff(pseudo_tf.indptr))
+    return csr_matrix(((idf[rows] * pseudo_tf.data * (k1 + 1) / (pseudo_tf.data + k1)).astype(np.float32),
+                       pseudo_tf.indices.astype(np.int32), pseudo_tf.indptr.astype(np.int32)), shape=pseudo_tf.shape)
+
+def _idf(df: np.ndarray, n: int) -> np.ndarray:
+    return np.log(1 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+class BM25FIndex:
+    """Field-aware BM25 over the JSON knowledge entries, as CSR matrices of impacts.
+
+    Row ``t`` of a segment holds, for every entry containing term ``t``, its
+    precomputed BM25F score contribution: field term frequencies are length
+    normalised per field, weighted and summed before the usual BM25 saturation.
+    Only field text is indexed, so JSON keys, punctuation and metadata never
+    reach the vocabulary.
+
+    ``build`` produces a single segment. ``append`` adds one segment for the new
+    entries, scored with the IDF and average field lengths frozen at the last
+    build, so its cost depends on the new entries only. A scheduled rebuild
+    (compaction) merges the segments and recomputes the statistics.
+    """
+
+    def __init__(self, terms: List[str], segments: List[csr_matrix], idf: np.ndarray, avg_len: np.ndarray,
+                 k1: float = BM25F_K1):
+        self.terms = terms
+        self.vocabulary = {term: row for row, term in enumerate(terms)}
+        self.segments = segments  # each (terms known when it was built, its entries), float32
+        self.idf = idf
+        self.avg_len = avg_len
+        self.k1 = k1
+
+    @classmethod
+    def build(cls, entries: List[Dict[str, Any]], k1: float = BM25F_K1) -> "BM25FIndex":
+        vocabulary: Dict[str, int] = {}
+        counts = _field_counts(entries, vocabulary)
+        lengths = counts[-1]
+        present = (lengths > 0).sum(axis=0)
+        avg_len = np.where(present > 0, lengths.sum(axis=0) / np.maximum(present, 1), 1).astype(np.float32)
+        pseudo_tf = _pseudo_tf(counts, avg_len, len(vocabulary))
+        idf = _idf(np.diff(pseudo_tf.indptr), len(entries))
+        terms = sorted(vocabulary, key=vocabulary.get)
+        return cls(terms, [_saturate(pseudo_tf, idf, k1)], idf, avg_len, k1)
+
+    def append(self, entries: List[Dict[str, Any]]) -> "BM25FIndex":
+        """A new index with ``entries`` added after the existing ones; this one is left untouched."""
+        vocabulary = dict(self.vocabulary)
+        counts = _field_counts(entries, vocabulary)
+        pseudo_tf = _pseudo_tf(counts, self.avg_len, len(vocabulary))
+        # Terms first seen here get an IDF from their frequency in the new entries alone
+        new_terms = len(vocabulary) - len(self.terms)
+        new_df = np.diff(pseudo_tf.indptr)[len(self.terms):]
+        idf = np.concatenate([self.idf, _idf(new_df, len(self) + len(entries))]) if new_terms else self.idf
+        terms = self.terms + sorted(vocabulary, key=vocabulary.get)[len(self.terms):]
+        return BM25FIndex(terms, self.segments + [_saturate(pseudo_tf, idf, self.k1)], idf, self.avg_len, self.k1)
+
+    @property
+    def postings(self) -> csr_matrix:
+        """The single segment of a freshly built (compacted) index."""
+        assert len(self.segments) == 1, "append segments are merged by rebuilding"
+        return self.segments[0]
+
+    def score(self, queries: List[str]) -> np.ndarray:
+        """``(queries, entries)`` BM25F scores; each distinct query term counts once."""
+        rows, cols = [], []
+        for i, query in enumerate(queries):
+            ids = {self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary}
+            rows.extend([i] * len(ids))
+            cols.extend(ids)
+        selector = csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                              shape=(len(queries), len(self.terms)))
+        if len(self.segments) == 1:
+            return (selector @ self.segments[0]).toarray()
+        # Older segments only know the terms that existed when they were built
+        return np.hstack([(selector[:, :segment.shape[0]] @ segment).toarray() for segment in self.segments])
+
+    def __len__(self) -> int:
+        return sum(segment.shape[1] for segment in self.segments)
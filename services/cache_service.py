@@ -1,18 +1,241 @@
+import base64
 import hashlib
-from typing import Optional
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple, List
+from sqlalchemy import func, text
 from sqlalchemy.orm import Session
 from models import RAGCache
+from core.config import (
+    STAGE_CACHE_MAX_QUERIES, STAGE_CACHE_TTL, STAGE_TTLS, RETRIEVAL_VERSION,
+    RAG_CACHE_MAX_BYTES, RAG_CACHE_EVICTION_POLICY, RAG_CACHE_COMPRESS_MIN_BYTES,
+    ROUTING_PROMPT, COMPRESSION_PROMPT, ANSWER_PROMPT, VERIFICATION_PROMPT, ARBITRATION_PROMPT,
+    ROUTING_MODEL, COMPRESSION_MODEL, GENERATION_MODELS, VERIFICATION_MODELS, ARBITRATION_MODEL,
+    FAST_MODE, AGREEMENT_METHOD, AGREEMENT_THRESHOLD, CONTEXT_TOKEN_BUDGETS, SNIPPET_DEDUP_THRESHOLD,
+)
+from services.context_packer import token_budget
+
+def _query_hash(query: str) -> str:
+    return hashlib.md5(query.encode()).hexdigest()
+
+def _fingerprint(*parts) -> str:
+    return hashlib.md5(json.dumps(parts).encode()).hexdigest()[:16]
+
+# Each stage is keyed by everything that shaped it, including the stages it was built from,
+# so editing a prompt or swapping a deployment invalidates exactly the affected stages.
+_ROUTING = _fingerprint(ROUTING_PROMPT, ROUTING_MODEL)
+_RETRIEVAL = _fingerprint(_ROUTING, RETRIEVAL_VERSION)
+_NARROWED = _fingerprint(_RETRIEVAL, COMPRESSION_PROMPT, COMPRESSION_MODEL,
+                         token_budget("compression", COMPRESSION_MODEL), SNIPPET_DEDUP_THRESHOLD)
+STAGE_FINGERPRINTS = {
+    "routing": _ROUTING,
+    "pdf_context": _RETRIEVAL,
+    "pdf_matches": _RETRIEVAL,
+    "json_context": _RETRIEVAL,
+    "narrowed": _NARROWED,
+    "final_result": _fingerprint(_NARROWED, ANSWER_PROMPT, VERIFICATION_PROMPT, ARBITRATION_PROMPT,
+                                 GENERATION_MODELS, VERIFICATION_MODELS, ARBITRATION_MODEL,
+                                 FAST_MODE, AGREEMENT_METHOD, AGREEMENT_THRESHOLD, CONTEXT_TOKEN_BUDGETS),
+}
+
+def _encode(content: str) -> Tuple[str, bool]:
+    if len(content) < RAG_CACHE_COMPRESS_MIN_BYTES:
+        return content, False
+    return base64.b64encode(zlib.compress(content.encode(), 6)).decode("ascii"), True
+
+def _decode(content: str, compressed: bool) -> str:
+    return zlib.decompress(base64.b64decode(content)).decode() if compressed else content
+
+def _is_fresh(stage: str, fingerprint: Optional[str], created_at: Optional[datetime], now: datetime) -> bool:
+    if fingerprint != STAGE_FINGERPRINTS.get(stage):
+        return False
+    ttl = STAGE_TTLS.get(stage)
+    return ttl is None or (created_at is not None and now - created_at < timedelta(seconds=ttl))
+
+class StageCache:
+    """Two-tier cache for pipeline stages: a bounded in-process LRU over ``rag_cache``.
+
+    Every stage of a query is fetched from SQLite in a single SELECT and kept in
+    memory as one entry, so hot queries never touch disk. Writes go to memory
+    immediately and are queued; ``flush`` persists all queued stages in one commit.
+    Rows produced with other prompts/models (see ``STAGE_FINGERPRINTS``) or older
+    than their stage TTL are ignored. Access counts are batched into the same flush
+    so the eviction job can rank entries by recency or frequency.
+    """
+
+    def __init__(self, max_queries: int = STAGE_CACHE_MAX_QUERIES, ttl: float = STAGE_CACHE_TTL):
+        self.max_queries = max_queries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, str]]]" = OrderedDict()
+        self._dirty: Dict[Tuple[str, str], str] = {}
+        self._accesses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "db_reads": 0, "db_commits": 0}
+
+    def _remember(self, query_hash: str, stages: Dict[str, str]):
+        self._entries[query_hash] = (time.monotonic() + self.ttl, stages)
+        self._entries.move_to_end(query_hash)
+        while len(self._entries) > self.max_queries:
+            self._entries.popitem(last=False)
+
+    def load(self, query: str, db: Session) -> Dict[str, str]:
+        """All fresh cached stages for ``query`` as ``{stage: content}``."""
+        query_hash = _query_hash(query)
+        with self._lock:
+            entry = self._entries.get(query_hash)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(query_hash)
+                self.stats["memory_hits"] += 1
+                if entry[1]:
+                    self._accesses[query_hash] = self._accesses.get(query_hash, 0) + 1
+                return dict(entry[1])
+
+        rows = db.query(RAGCache.stage, RAGCache.content, RAGCache.fingerprint, RAGCache.created_at,
+                        RAGCache.compressed).filter_by(query_hash=query_hash).all()
+        now = datetime.utcnow()
+        stages = {stage: _decode(content, compressed) for stage, content, fingerprint, created_at, compressed in rows
+                  if _is_fresh(stage, fingerprint, created_at, now)}
+        with self._lock:
+            self.stats["db_reads"] += 1
+            self.stats["db_hits" if stages else "misses"] += 1
+            if stages:
+                self._accesses[query_hash] = self._accesses.get(query_hash, 0) + 1
+            # Queued writes are newer than what is on disk
+            stages.update({s: c for (h, s), c in self._dirty.items() if h == query_hash})
+            self._remember(query_hash, stages)
+        return dict(stages)
+
+    def put(self, query: str, stage: str, content: str):
+        query_hash = _query_hash(query)
+        with self._lock:
+            entry = self._entries.get(query_hash)
+            stages = dict(entry[1]) if entry else {}
+            stages[stage] = content
+            self._remember(query_hash, stages)
+            self._dirty[(query_hash, stage)] = content
+
+    def flush(self, db: Session):
+        """Write every queued stage and access count to SQLite in one transaction."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            accesses, self._accesses = self._accesses, {}
+        if not dirty and not accesses:
+            return
+        try:
+            now = datetime.utcnow()
+            hashes = {h for h, _ in dirty} | set(accesses)
+            existing = {(r.query_hash, r.stage): r
+                        for r in db.query(RAGCache).filter(RAGCache.query_hash.in_(hashes)).all()}
+            for (query_hash, stage), content in dirty.items():
+                stored, compressed = _encode(content)
+                row = existing.get((query_hash, stage))
+                if row is None:
+                    row = RAGCache(query_hash=query_hash, stage=stage, hit_count=0)
+                    db.add(row)
+                    existing[(query_hash, stage)] = row
+                row.content, row.compressed = stored, compressed
+                row.fingerprint = STAGE_FINGERPRINTS.get(stage)
+                row.created_at = row.last_accessed = now
+            for (query_hash, _), row in existing.items():
+                if query_hash in accesses:
+                    row.hit_count = (row.hit_count or 0) + accesses[query_hash]
+                    row.last_accessed = now
+            db.commit()
+            self.stats["db_commits"] += 1
+        except Exception:
+            db.rollback()
+            with self._lock:
+                # Keep the writes for the next flush unless newer ones were queued meanwhile
+                for key, content in dirty.items():
+                    self._dirty.setdefault(key, content)
+            raise
+
+    def evict(self, query: str):
+        self.evict_hashes([_query_hash(query)])
+
+    def evict_hashes(self, query_hashes: List[str]):
+        gone = set(query_hashes)
+        with self._lock:
+            for query_hash in gone:
+                self._entries.pop(query_hash, None)
+                self._accesses.pop(query_hash, None)
+            self._dirty = {k: v for k, v in self._dirty.items() if k[0] not in gone}
+
+    def get_stats(self) -> Dict[str, float]:
+        lookups = self.stats["memory_hits"] + self.stats["db_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "pending_writes": len(self._dirty),
+            "memory_hit_rate": self.stats["memory_hits"] / lookups if lookups else 0.0,
+            "db_hit_rate": self.stats["db_hits"] / lookups if lookups else 0.0,
+        }
+
+stage_cache = StageCache()
 
 def load_cache_stage_db(query: str, stage: str, db: Session) -> Optional[str]:
-    query_hash = hashlib.md5(query.encode()).hexdigest()
-    record = db.query(RAGCache).filter_by(query_hash=query_hash, stage=stage).first()
-    return record.content if record else None
+    return stage_cache.load(query, db).get(stage)
 
 def save_cache_stage_db(query: str, stage: str, content: str, db: Session):
-    query_hash = hashlib.md5(query.encode()).hexdigest()
-    existing = db.query(RAGCache).filter_by(query_hash=query_hash, stage=stage).first()
-    if existing:
-        existing.content = content
+    stage_cache.put(query, stage, content)
+    stage_cache.flush(db)
+
+def delete_cache_stages_db(query: str, db: Session) -> int:
+    stage_cache.evict(query)
+    deleted = db.query(RAGCache).filter_by(query_hash=_query_hash(query)).delete()
+    db.commit()
+    return deleted
+
+def enforce_cache_limits(db: Session, max_bytes: int = RAG_CACHE_MAX_BYTES,
+                         policy: str = RAG_CACHE_EVICTION_POLICY) -> Dict[str, int]:
+    """Drop expired and stale-fingerprint rows, then evict whole queries until under ``max_bytes``.
+
+    ``policy`` picks the victims: "lru" evicts the least recently used queries first,
+    "lfu" the least frequently used (ties broken by recency).
+    """
+    stage_cache.flush(db)  # so pending access counts take part in the ranking
+    now = datetime.utcnow()
+    removed_rows = 0
+    for stage, fingerprint in STAGE_FINGERPRINTS.items():
+        stale = db.query(RAGCache).filter(RAGCache.stage == stage,
+                                          (RAGCache.fingerprint != fingerprint) | RAGCache.fingerprint.is_(None))
+        ttl = STAGE_TTLS.get(stage)
+        expired = db.query(RAGCache).filter(RAGCache.stage == stage,
+                                            RAGCache.created_at < now - timedelta(seconds=ttl)) if ttl else None
+        removed_rows += stale.delete(synchronize_session=False)
+        if expired is not None:
+            removed_rows += expired.delete(synchronize_session=False)
+    db.commit()
+
+    sizes = db.query(
+        RAGCache.query_hash,
+        func.sum(func.length(RAGCache.content)),
+        func.max(func.coalesce(RAGCache.last_accessed, RAGCache.created_at)),
+        func.sum(func.coalesce(RAGCache.hit_count, 0)),
+    ).group_by(RAGCache.query_hash).all()
+    total = sum(size or 0 for _, size, _, _ in sizes)
+    if policy == "lfu":
+        sizes.sort(key=lambda r: (r[3], r[2] or datetime.min))
     else:
-        db.add(RAGCache(query_hash=query_hash, stage=stage, content=content))
+        sizes.sort(key=lambda r: r[2] or datetime.min)
+
+    victims = []
+    for query_hash, size, _, _ in sizes:
+        if total <= max_bytes:
+            break
+        victims.append(query_hash)
+        total -= size or 0
+    for i in range(0, len(victims), 500):
+        removed_rows += db.query(RAGCache).filter(RAGCache.query_hash.in_(victims[i:i + 500])).delete(synchronize_session=False)
     db.commit()
+    stage_cache.evict_hashes(victims)
+
+    if removed_rows:
+        # VACUUM cannot run inside a transaction; it gives the freed pages back to the filesystem
+        with db.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+    return {"removed_rows": removed_rows, "evicted_queries": len(victims), "bytes": total}
@@ -0,0 +1,61 @@
+import re
+from typing import Iterable, List
+from core.config import CONTEXT_TOKEN_BUDGETS, SNIPPET_DEDUP_THRESHOLD
+from core.utils import count_tokens, truncate_to_tokens
+
+def token_budget(section: str, deployment: str = "default") -> int:
+    budgets = CONTEXT_TOKEN_BUDGETS.get(deployment, {})
+    return budgets.get(section, CONTEXT_TOKEN_BUDGETS["default"][section])
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _is_duplicate(shingles: set, selected: List[set], threshold: float) -> bool:
+    # Containment rather than Jaccard, so a snippet fully quoted inside a longer one also counts
+    return any(len(shingles & other) / max(1, min(len(shingles), len(other))) >= threshold for other in selected)
+
+def pack_snippets(snippets: Iterable[str], budget: int, separator: str = "\n\n",
+                  dedup_threshold: float = SNIPPET_DEDUP_THRESHOLD) -> str:
+    """Fill ``budget`` tokens with whole snippets, best-ranked first.
+
+    Snippets that overlap an already selected one are dropped; snippets that do not
+    fit are skipped so a smaller, lower-ranked one can still use the space. Only when
+    not even the top snippet fits is it truncated, so the best evidence always survives.
+    """
+    selected, selected_shingles, used = [], [], 0
+    sep_cost = count_tokens(separator)
+    first = None
+    for snippet in snippets:
+        snippet = snippet.strip()
+        if not snippet:
+            continue
+        first = first or snippet
+        shingles = _shingles(snippet)
+        if _is_duplicate(shingles, selected_shingles, dedup_threshold):
+            continue
+        cost = count_tokens(snippet) + (sep_cost if selected else 0)
+        if used + cost > budget:
+            continue
+        selected.append(snippet)
+        selected_shingles.append(shingles)
+        used += cost
+    if not selected and first:
+        return truncate_to_tokens(first, budget)
+    return separator.join(selected)
+
+def interleave(*ranked_lists: List[str]) -> List[str]:
+    """Round-robin merge, so every source keeps its best snippets under a shared budget."""
+    merged = []
+    for i in range(max((len(r) for r in ranked_lists), default=0)):
+        merged.extend(r[i] for r in ranked_lists if i < len(r))
+    return merged
+
+def fit_each(texts: List[str], budget: int) -> List[str]:
+    """Split ``budget`` evenly so every text (e.g. each model's answer) keeps its share."""
+    if not texts:
+        return []
+    share = max(1, budget // len(texts))
+    return [truncate_to_tokens(t, share) for t in texts]
@@ -0,0 +1,152 @@
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+from services.context_packer import token_budget
+from services.model_service import call_model, ModelAPIError
+from core.config import CONVERSATION_DB_PATH, MEMORY_RECENT_TURNS, MEMORY_SUMMARY_MODEL, MEMORY_SUMMARY_PROMPT
+from core.utils import count_tokens, truncate_to_tokens
+
+def _ensure_schema(conn: sqlite3.Connection):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        user_input TEXT NOT NULL,
+        system_response TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_session ON conversations (session_id)")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS conversation_summaries (
+        session_id TEXT PRIMARY KEY,
+        summary TEXT NOT NULL,
+        summarized_through INTEGER NOT NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+def _format_turns(turns: List[Tuple[str, str]]) -> str:
+    return "\n".join(f"Student: {q}\nTutor: {a}" for q, a in turns)
+
+def turns_from_history(history: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """Pair ``{"role", "content"}`` messages into (question, answer) turns."""
+    turns, question = [], None
+    for message in history:
+        role, content = message.get("role"), str(message.get("content", ""))
+        if role == "user":
+            question = content
+        elif role == "assistant" and question is not None:
+            turns.append((question, content))
+            question = None
+    return turns
+
+class ConversationMemory:
+    """Bounded memory for one tutoring session.
+
+    The last ``recent_turns`` turns stay verbatim; older ones are folded into a
+    rolling summary, so ``render()`` stays within the "conversation" token budget
+    however long the session runs. With a ``session_id`` the turns and summary live
+    in conversation_history.db; without one the memory is in-process only.
+    """
+
+    def __init__(self, session_id: Optional[str] = None, db_path: str = CONVERSATION_DB_PATH,
+                 recent_turns: int = MEMORY_RECENT_TURNS, model: str = MEMORY_SUMMARY_MODEL):
+        self.session_id = session_id
+        self.db_path = db_path
+        self.recent_turns = recent_turns
+        self.model = model
+        self.budget = token_budget("conversation")
+        self.summary_budget = token_budget("conversation_summary")
+        self.summary = ""
+        self.summarized_through = 0
+        self.turns: List[Tuple[int, str, str]] = []  # (conversations.id, question, answer), oldest first
+        if session_id:
+            self._load()
+
+    @classmethod
+    def from_history(cls, history: List[Dict[str, Any]]) -> "ConversationMemory":
+        """Ephemeral memory for a client-supplied message list; older turns are squeezed without an LLM call."""
+        memory = cls()
+        memory.turns = [(0, q, a) for q, a in turns_from_history(history)]
+        memory._fold(summarize=False)
+        return memory
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        _ensure_schema(conn)
+        return conn
+
+    def _load(self):
+        with self._connect() as conn:
+            row = conn.execute("SELECT summary, summarized_through FROM conversation_summaries WHERE session_id = ?",
+                               (self.session_id,)).fetchone()
+            if row:
+                self.summary, self.summarized_through = row
+            self.turns = conn.execute(
+                "SELECT id, user_input, system_response FROM conversations WHERE session_id = ? AND id > ? ORDER BY id",
+                (self.session_id, self.summarized_through)
+            ).fetchall()
+
+    def add_turn(self, question: str, answer: str, summarize: bool = True):
+        """Record a finished turn, then fold old turns until the memory fits its budget."""
+        turn_id = 0
+        if self.session_id:
+            with self._connect() as conn:
+                cursor = conn.execute(
+                    "INSERT INTO conversations (session_id, user_input, system_response) VALUES (?, ?, ?)",
+                    (self.session_id, question, answer)
+                )
+                turn_id = cursor.lastrowid
+        self.turns.append((turn_id, question, answer))
+        self._fold(summarize)
+
+    def _over_budget(self) -> bool:
+        if len(self.turns) > self.recent_turns:
+            return True
+        return len(self.turns) > 1 and count_tokens(self._text()) > self.budget
+
+    def _fold(self, summarize: bool):
+        folded = []
+        while self._over_budget():
+            folded.append(self.turns.pop(0))
+        if not folded:
+            return
+        self.summary = self._summarize([(q, a) for _, q, a in folded], summarize)
+        self.summarized_through = max(self.summarized_through, folded[-1][0])
+        if self.session_id:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO conversation_summaries (session_id, summary, summarized_through, updated_at) "
+                    "VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
+                    (self.session_id, self.summary, self.summarized_through)
+                )
+
+    def _summarize(self, turns: List[Tuple[str, str]], use_model: bool) -> str:
+        if use_model:
+            try:
+                summary = call_model(self.model, [
+                    {"role": "system", "content": MEMORY_SUMMARY_PROMPT},
+                    {"role": "user", "content": f"Current summary:\n{self.summary or '(none)'}\n\n"
+                                                f"New turns:\n{_format_turns(turns)}"}
+                ])
+                return truncate_to_tokens(summary.strip(), self.summary_budget)
+            except ModelAPIError as e:
+                print(f"[MEMORY] Summary update failed, keeping an extractive summary: {e}")
+        # Without the model keep the questions, newest last, and let the budget drop the oldest
+        lines = self.summary.splitlines() + [f"- Student asked: {q.strip()[:200]}" for q, _ in turns]
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > self.summary_budget:
+            lines.pop(0)
+        return truncate_to_tokens("\n".join(lines), self.summary_budget)
+
+    def _text(self) -> str:
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier conversation:\n{self.summary}")
+        if self.turns:
+            parts.append(f"Recent turns:\n{_format_turns([(q, a) for _, q, a in self.turns])}")
+        return "\n\n".join(parts)
+
+    def render(self) -> str:
+        """Summary plus recent turns as prompt text, empty for a new conversation."""
+        # Folding keeps this within budget unless a single turn is larger than all of it
+        return truncate_to_tokens(self._text(), self.budget)
@@ -0,0 +1,59 @@
+import sqlite3
+from collections import Counter
+from typing import Optional, Sequence, Tuple
+import numpy as np
+
+def encode_embedding(vector) -> Optional[bytes]:
+    """An embedding as a float32 BLOB for knowledge_base.embedding_vector."""
+    if vector is None:
+        return None
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+def _as_blob(value) -> Optional[bytes]:
+    if value is None or value == "" or value == b"":
+        return None
+    if isinstance(value, str):
+        # Comma-separated TEXT written before the BLOB format; run migrate_embeddings.py once
+        return encode_embedding(np.array(value.split(","), dtype=np.float32))
+    return bytes(value)
+
+def embedding_matrix(values: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+    """Stack stored embeddings into ``(rows, matrix)``.
+
+    ``rows`` are the positions in ``values`` that had an embedding and ``matrix``
+    holds them as float32, decoded from the joined BLOBs with a single
+    ``np.frombuffer``. Embeddings whose dimension differs from the most common
+    one are skipped.
+    """
+    rows, blobs = [], []
+    for row, value in enumerate(values):
+        blob = _as_blob(value)
+        if blob:
+            rows.append(row)
+            blobs.append(blob)
+    if not blobs:
+        return np.empty(0, dtype=np.intp), np.empty((0, 0), dtype=np.float32)
+    size = Counter(len(blob) for blob in blobs).most_common(1)[0][0]
+    if any(len(blob) != size for blob in blobs):
+        kept = [i for i, blob in enumerate(blobs) if len(blob) == size]
+        print(f"Skipping {len(blobs) - len(kept)} embeddings with a different dimension")
+        rows, blobs = [rows[i] for i in kept], [blobs[i] for i in kept]
+    matrix = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), size // 4)
+    return np.array(rows, dtype=np.intp), matrix
+
+def migrate_text_embeddings(db_path: str, batch_size: int = 1000) -> int:
+    """Rewrite comma-separated TEXT embeddings in knowledge_base as float32 BLOBs; returns the rows converted."""
+    converted = 0
+    with sqlite3.connect(db_path) as conn:
+        while True:
+            rows = conn.execute(
+                "SELECT id, embedding_vector FROM knowledge_base WHERE typeof(embedding_vector) = 'text' LIMIT ?",
+                (batch_size,)
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany("UPDATE knowledge_base SET embedding_vector = ? WHERE id = ?",
+                             [(_as_blob(text), db_id) for db_id, text in rows])
+            conn.commit()
+            converted += len(rows)
+    return converted
@@ -0,0 +1,54 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+class IndexManager(Generic[T]):
+    """Holds the current snapshot of an index and replaces it atomically.
+
+    A snapshot is never modified once published. ``rebuild`` builds its successor
+    entirely off to the side and then swaps one reference, so a search that
+    grabbed ``current()`` keeps a consistent view until it finishes while new
+    searches see the new snapshot. Concurrent rebuilds are serialized.
+    """
+
+    def __init__(self, name: str, build: Callable[..., T]):
+        self.name = name
+        self._build = build
+        self._snapshot: Optional[T] = None
+        self._build_lock = threading.Lock()
+        self.version = 0
+        self.last_build_seconds: Optional[float] = None
+        self.building = False
+
+    def current(self) -> Optional[T]:
+        return self._snapshot
+
+    def rebuild(self, *args, **kwargs) -> T:
+        return self._swap(lambda current: self._build(*args, **kwargs), "rebuilt")
+
+    def update(self, change: Callable[[Optional[T]], T]) -> T:
+        """Swap in ``change(current)``, e.g. the current snapshot plus a few appended documents.
+
+        Runs under the same lock as ``rebuild``, so an update never derives from a
+        snapshot that a concurrent rebuild is about to replace.
+        """
+        return self._swap(change, "updated")
+
+    def _swap(self, make: Callable[[Optional[T]], T], verb: str) -> T:
+        with self._build_lock:
+            self.building = True
+            started = time.perf_counter()
+            try:
+                snapshot = make(self._snapshot)
+            finally:
+                self.building = False
+            self._snapshot = snapshot  # the swap: a single reference assignment
+            self.version += 1
+            self.last_build_seconds = round(time.perf_counter() - started, 3)
+        print(f"[INDEX] {self.name} snapshot v{self.version} {verb} and swapped in after {self.last_build_seconds}s")
+        return snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        return {"version": self.version, "building": self.building, "last_build_seconds": self.last_build_seconds}
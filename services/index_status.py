@@ -0,0 +1,69 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from services.metrics import register_collector
+
+class IndexStatus:
+    """Build state of one retrieval index.
+
+    ``state`` moves pending -> building -> ready | failed. ``ready`` stays True once
+    any build has succeeded, so a scheduled rebuild keeps serving the old index.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "pending"
+        self.ready = False
+        self.size = 0
+        self.build_seconds: Optional[float] = None
+        self.built_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"state": self.state, "ready": self.ready, "size": self.size, "build_seconds": self.build_seconds,
+                "built_at": self.built_at, "error": self.error}
+
+INDEX_NAMES = ("pdf", "json")
+_indexes: Dict[str, IndexStatus] = {name: IndexStatus(name) for name in INDEX_NAMES}
+_lock = threading.Lock()
+
+def index_ready(name: str) -> bool:
+    return _indexes[name].ready
+
+def index_states() -> Dict[str, Dict[str, Any]]:
+    with _lock:
+        return {name: status.as_dict() for name, status in _indexes.items()}
+
+def track_build(name: str, build: Callable[[], int]) -> bool:
+    """Run ``build`` (which returns the index size) and record its state and duration.
+
+    Errors are logged and recorded rather than raised, since builds run in
+    background threads.
+    """
+    status = _indexes[name]
+    with _lock:
+        status.state, status.error = "building", None
+    started = time.perf_counter()
+    try:
+        size = build()
+    except Exception as e:
+        with _lock:
+            status.state, status.error = "failed", f"{type(e).__name__}: {e}"
+            status.build_seconds = round(time.perf_counter() - started, 3)
+        print(f"[INDEX] {name} build failed after {status.build_seconds}s: {status.error}")
+        return False
+    with _lock:
+        status.state, status.ready, status.size = "ready", True, size
+        status.build_seconds = round(time.perf_counter() - started, 3)
+        status.built_at = time.time()
+    print(f"[INDEX] {name} ready in {status.build_seconds}s ({size} entries)")
+    return True
+
+register_collector(
+    "retrieval_index_ready", "1 once the retrieval index can serve queries", ("index",),
+    lambda: {(name, ): float(st["ready"]) for name, st in index_states().items()},
+)
+register_collector(
+    "retrieval_index_build_seconds", "Duration of the last build of each retrieval index", ("index",),
+    lambda: {(name, ): st["build_seconds"] for name, st in index_states().items() if st["build_seconds"] is not None},
+)
@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from scipy.sparse import csr_matrix
+from core.config import JSON_INDEX_DIR
+
+_ARRAYS = ("data", "indices", "indptr")
+
+def corpus_fingerprint(entries: List[Dict[str, Any]], params: Dict[str, Any]) -> str:
+    """Changes whenever the entries or the index settings do."""
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode())
+    digest.update(json.dumps(entries).encode())
+    return digest.hexdigest()
+
+def _artifact_dir(fingerprint: str, directory: str) -> str:
+    return os.path.join(directory, fingerprint[:16])
+
+def save_index(fingerprint: str, terms: List[str], matrix: csr_matrix, extra: Dict[str, np.ndarray],
+               directory: str = JSON_INDEX_DIR):
+    """Write the vocabulary (``terms`` in row order), the CSR arrays and ``extra`` arrays such as
+    collection statistics, replacing artifacts of other fingerprints.
+
+    Each array is its own ``.npy`` file (members of an ``.npz`` cannot be memory-mapped);
+    meta.json is written last, so a half-written directory is never loaded.
+    """
+    target = _artifact_dir(fingerprint, directory)
+    staging = target + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    arrays = {"data": matrix.data, "indices": matrix.indices, "indptr": matrix.indptr, **extra}
+    for name, array in arrays.items():
+        np.save(os.path.join(staging, f"{name}.npy"), array)
+    with open(os.path.join(staging, "vocabulary.json"), "w") as f:
+        json.dump(terms, f)
+    with open(os.path.join(staging, "meta.json"), "w") as f:
+        json.dump({"fingerprint": fingerprint, "shape": list(matrix.shape), "extra": sorted(extra)}, f)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+    for name in os.listdir(directory):
+        if name != os.path.basename(target):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+def load_index(fingerprint: str,
+               directory: str = JSON_INDEX_DIR) -> Optional[Tuple[List[str], csr_matrix, Dict[str, np.ndarray]]]:
+    """The vocabulary, matrix and extra arrays saved for ``fingerprint``, or None if there are none.
+
+    The CSR arrays are memory-mapped, so loading costs page faults rather than a full read.
+    """
+    target = _artifact_dir(fingerprint, directory)
+    try:
+        with open(os.path.join(target, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["fingerprint"] != fingerprint:
+            return None
+        arrays = {name: np.load(os.path.join(target, f"{name}.npy"), mmap_mode="r")
+                  for name in _ARRAYS + tuple(meta.get("extra", ()))}
+        with open(os.path.join(target, "vocabulary.json")) as f:
+            terms = json.load(f)
+    except (OSError, ValueError, KeyError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Ignoring unreadable index artifacts in {target}: {e}")
+        return None
+    matrix = csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape=tuple(meta["shape"]), copy=False)
+    return terms, matrix, {name: np.asarray(arrays[name]) for name in meta.get("extra", ())}
@@ -0,0 +1,124 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Seconds; covers sub-millisecond cache hits up to the 30 s model timeout
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...], le: Optional[str] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(self.labels, values)} {total}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help_text, labels, buckets
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            # Non-cumulative bucket counts, then an overflow slot, sum and count
+            series = self._series.setdefault(label_values, [0.0] * (len(self.buckets) + 3))
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_label_str(self.labels, values, str(bound))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_label_str(self.labels, values, '+Inf')} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_str(self.labels, values)} {series[-2]}")
+                lines.append(f"{self.name}_count{_label_str(self.labels, values)} {series[-1]}")
+        return lines
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent in each /ragAI pipeline stage", ("stage",))
+MODEL_CALL_SECONDS = Histogram("model_call_seconds", "Latency of model API calls", ("deployment", "kind", "status"))
+MODEL_CHARS = Counter("model_chars_total", "Characters sent to and received from each deployment", ("deployment", "direction"))
+MODEL_TOKENS = Counter("model_tokens_total", "Tokens reported by the model API usage block", ("deployment", "direction"))
+MODEL_HEDGES = Counter("model_hedges_total", "Hedged and failed-over chat calls by outcome", ("deployment", "outcome"))
+CODE_EXECUTION_SECONDS = Histogram("code_execution_seconds", "Time spent compiling and running submitted code", ("endpoint", "phase"))
+
+_METRICS = [STAGE_SECONDS, MODEL_CALL_SECONDS, MODEL_CHARS, MODEL_TOKENS, MODEL_HEDGES, CODE_EXECUTION_SECONDS]
+_COLLECTORS: List[Tuple[str, str, Tuple[str, ...], Callable[[], Dict[Tuple[str, ...], float]], str]] = []
+
+def register_collector(name: str, help_text: str, labels: Tuple[str, ...],
+                       collect: Callable[[], Dict[Tuple[str, ...], float]], metric_type: str = "gauge"):
+    """Export values computed at scrape time, e.g. cache or single-flight statistics."""
+    _COLLECTORS.append((name, help_text, labels, collect, metric_type))
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for name, help_text, labels, collect, metric_type in _COLLECTORS:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+        for values, value in sorted(collect().items()):
+            lines.append(f"{name}{_label_str(labels, values)} {float(value)}")
+    return "\n".join(lines) + "\n"
+
+# Per-request timings, attached to debug_log by the pipeline
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+def start_request_timings() -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+def record_timing(name: str, seconds: float):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = round(timings.get(name, 0.0) + seconds, 4)
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage)
+        record_timing(stage, elapsed)
+
+def observe_model_call(deployment: str, kind: str, status: str, seconds: float,
+                       prompt_chars: int = 0, completion_chars: int = 0, usage: Optional[Dict[str, int]] = None):
+    MODEL_CALL_SECONDS.observe(seconds, deployment, kind, status)
+    record_timing(f"model:{deployment}", seconds)
+    if prompt_chars:
+        MODEL_CHARS.inc(deployment, "prompt", amount=prompt_chars)
+    if completion_chars:
+        MODEL_CHARS.inc(deployment, "completion", amount=completion_chars)
+    if usage:
+        if usage.get("prompt_tokens"):
+            MODEL_TOKENS.inc(deployment, "prompt", amount=usage["prompt_tokens"])
+        if usage.get("completion_tokens"):
+            MODEL_TOKENS.inc(deployment, "completion", amount=usage["completion_tokens"])
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from core.config import (
+    MODEL_CLIENT_POOL_CONNECTIONS, MODEL_CLIENT_POOL_MAXSIZE, MODEL_CLIENT_MAX_RETRIES,
+    MODEL_CLIENT_BACKOFF, MODEL_CLIENT_TIMEOUT,
+)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class ModelClient:
+    """Pooled HTTP client for the model endpoints.
+
+    Keeps one keep-alive ``requests.Session`` per base URL so repeated LLM calls
+    reuse TCP/TLS connections. Retries with exponential backoff happen at the
+    transport level (connect errors, 429 and 5xx). The async API runs the same
+    pooled session on a dedicated executor sized to the pool, so async callers
+    can never open more connections than ``pool_maxsize``.
+    """
+
+    def __init__(self, pool_connections: int = MODEL_CLIENT_POOL_CONNECTIONS,
+                 pool_maxsize: int = MODEL_CLIENT_POOL_MAXSIZE,
+                 max_retries: int = MODEL_CLIENT_MAX_RETRIES,
+                 backoff_factor: float = MODEL_CLIENT_BACKOFF,
+                 timeout: float = MODEL_CLIENT_TIMEOUT):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_maxsize, thread_name_prefix="model-client")
+
+    def _session(self, base_url: str) -> requests.Session:
+        session = self._sessions.get(base_url)
+        if session is not None:
+            return session
+        with self._lock:
+            if base_url not in self._sessions:
+                retry = Retry(
+                    total=self.max_retries,
+                    connect=self.max_retries,
+                    read=0,  # a read timeout means the model is slow; retrying only doubles the wait
+                    status=self.max_retries,
+                    backoff_factor=self.backoff_factor,
+                    status_forcelist=RETRY_STATUSES,
+                    allowed_methods=frozenset({"POST"}),
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                                      pool_maxsize=self.pool_maxsize, max_retries=retry)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[base_url] = session
+            return self._sessions[base_url]
+
+    def post(self, base_url: str, path: str, payload: Dict[str, Any],
+             headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        response = self._session(base_url).post(
+            f"{base_url}{path}", json=payload, headers=headers, timeout=timeout or self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def apost(self, base_url: str, path: str, payload: Dict[str, Any],
+                    headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: self.post(base_url, path, payload, headers, timeout))
+
+    def stream(self, base_url: str, path: str, payload: Dict[str, Any],
+               headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """POST with ``stream: true`` and yield each server-sent ``data:`` event as a dict."""
+        with self._session(base_url).post(
+            f"{base_url}{path}", json=payload, headers=headers, timeout=timeout or self.timeout, stream=True
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                yield json.loads(data)
+
+    async def astream(self, base_url: str, path: str, payload: Dict[str, Any],
+                      headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        events = self.stream(base_url, path, payload, headers, timeout)
+        done = object()
+        try:
+            while True:
+                event = await loop.run_in_executor(self._executor, next, events, done)
+                if event is done:
+                    break
+                yield event
+        finally:
+            # Release the pooled connection even if the consumer stops early
+            try:
+                await loop.run_in_executor(self._executor, events.close)
+            except ValueError:
+                pass  # still running in a worker after cancellation; it closes itself when done
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+        self._executor.shutdown(wait=False)
+
+_client: Optional[ModelClient] = None
+_client_lock = threading.Lock()
+
+def get_model_client() -> ModelClient:
+    """Process-wide shared client, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ModelClient()
+    return _client
@@ -1,14 +1,23 @@
+import asyncio
+import time
 import requests
-from typing import List, Dict, Union
-from core.config import MODEL_API_VERSIONS, MODEL_ENDPOINTS, BASE_URL, API_KEY
+from typing import List, Dict, Union, Any, Tuple, Iterator, AsyncIterator
+from core.config import MODEL_API_VERSIONS, MODEL_ENDPOINTS, BASE_URL, API_KEY, HEDGING_ENABLED
 from core.utils import get_model_type
+from services.model_client import get_model_client
+from services.metrics import observe_model_call, MODEL_HEDGES
+from services.resilience import (
+    ModelAPIError, ModelTimeoutError, CircuitOpenError, circuit_breaker, candidate_deployments, latency_tracker,
+)
 
-def call_model(deployment: str, messages: List[Dict[str, str]]) -> str:
+def _headers() -> Dict[str, str]:
+    return {"Content-Type": "application/json", "api-key": API_KEY}
+
+def _chat_request(deployment: str, messages: List[Dict[str, str]]) -> Tuple[str, str, Dict[str, Any]]:
     api_version = MODEL_API_VERSIONS.get(deployment)
     model_type = get_model_type(deployment)
     endpoint = MODEL_ENDPOINTS.get(model_type)
-    url = f"{BASE_URL}/deployments/{deployment}{endpoint}?api-version={api_version}"
-    headers = {"Content-Type": "application/json", "api-key": API_KEY}
+    path = f"/deployments/{deployment}{endpoint}?api-version={api_version}"
 
     if model_type in {"gpt", "deepseek"}:
         payload = {"messages": messages}
@@ -24,37 +33,225 @@ def call_model(deployment: str, messages: List[Dict[str, str]]) -> str:
             },
             "stream": False
         }
+    return model_type, path, payload
 
-    try:
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        
-        if model_type in {"gpt", "deepseek"}:
-            return data["choices"][0]["message"]["content"]
-        if model_type == "gemini":
-            return data["candidates"][0]["content"]["parts"][0]["text"]
-        return "Unexpected response format"
-    except Exception as e:
-        print(f"[ERROR] Model {deployment} call failed: {str(e)}")
-        return f"Model API error: {str(e)}"
+def _prompt_chars(messages: List[Dict[str, str]]) -> int:
+    return sum(len(m.get("content") or "") for m in messages)
 
-def call_embedding_model(deployment: str, input_text: Union[str, List[str]]) -> List[List[float]]:
+def _chat_content(model_type: str, data: Dict[str, Any]) -> str:
+    if model_type in {"gpt", "deepseek"}:
+        return data["choices"][0]["message"]["content"]
+    if model_type == "gemini":
+        return data["candidates"][0]["content"]["parts"][0]["text"]
+    return "Unexpected response format"
+
+def _embedding_request(deployment: str, input_text: Union[str, List[str]]) -> Tuple[str, Dict[str, Any]]:
     api_version = MODEL_API_VERSIONS.get(deployment)
     endpoint = MODEL_ENDPOINTS.get("embedding") # Use the generic embedding endpoint
-    url = f"{BASE_URL}/deployments/{deployment}{endpoint}?api-version={api_version}"
-    headers = {"Content-Type": "application/json", "api-key": API_KEY}
+    return f"/deployments/{deployment}{endpoint}?api-version={api_version}", {"input": input_text}
+
+def _embeddings(data: Dict[str, Any]) -> List[List[float]]:
+    if "data" in data and isinstance(data["data"], list):
+        return [item["embedding"] for item in data["data"]]
+    return []
+
+def _error(deployment: str, e: Exception) -> ModelAPIError:
+    if isinstance(e, ModelAPIError):
+        return e
+    if isinstance(e, requests.Timeout):
+        return ModelTimeoutError(deployment, str(e))
+    return ModelAPIError(deployment, str(e))
+
+def _claim(deployment: str):
+    # The breaker may have opened between choosing candidates and calling
+    if not circuit_breaker(deployment).allow():
+        raise CircuitOpenError(deployment, "circuit open")
+
+def _record(deployment: str, model_type: str, messages: List[Dict[str, str]], start: float,
+            data: Dict[str, Any]) -> str:
+    content = _chat_content(model_type, data)
+    elapsed = time.perf_counter() - start
+    circuit_breaker(deployment).record_success()
+    latency_tracker.record(deployment, elapsed)
+    observe_model_call(deployment, "chat", "ok", elapsed, _prompt_chars(messages), len(content), data.get("usage"))
+    return content
 
-    payload = {"input": input_text}
+def _record_failure(deployment: str, messages: List[Dict[str, str]], start: float, e: Exception) -> ModelAPIError:
+    circuit_breaker(deployment).record_failure()
+    observe_model_call(deployment, "chat", "error", time.perf_counter() - start, _prompt_chars(messages))
+    print(f"[ERROR] Model {deployment} call failed: {str(e)}")
+    return _error(deployment, e)
 
+def _call_once(deployment: str, messages: List[Dict[str, str]]) -> str:
+    _claim(deployment)
+    model_type, path, payload = _chat_request(deployment, messages)
+    start = time.perf_counter()
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        
-        if "data" in data and isinstance(data["data"], list):
-            return [item["embedding"] for item in data["data"]]
+        data = get_model_client().post(BASE_URL, path, payload, headers=_headers())
+        return _record(deployment, model_type, messages, start, data)
+    except Exception as e:
+        raise _record_failure(deployment, messages, start, e) from e
+
+async def _acall_once(deployment: str, messages: List[Dict[str, str]]) -> str:
+    _claim(deployment)
+    model_type, path, payload = _chat_request(deployment, messages)
+    start = time.perf_counter()
+    try:
+        data = await get_model_client().apost(BASE_URL, path, payload, headers=_headers())
+        return _record(deployment, model_type, messages, start, data)
+    except Exception as e:
+        raise _record_failure(deployment, messages, start, e) from e
+
+def _discard_result(task: asyncio.Future):
+    if not task.cancelled():
+        task.exception()  # mark retrieved so asyncio doesn't log it
+
+def call_model_served(deployment: str, messages: List[Dict[str, str]]) -> Tuple[str, str]:
+    """Chat completion from ``deployment``, failing over to an equivalent if it errors.
+
+    Returns ``(content, served_by)``, the deployment that actually answered.
+    Raises ModelAPIError (or a subclass) when no candidate deployment answers.
+    """
+    candidates = candidate_deployments(deployment)
+    try:
+        return _call_once(candidates[0], messages), candidates[0]
+    except ModelAPIError:
+        if len(candidates) < 2:
+            raise
+        MODEL_HEDGES.inc(deployment, "failover")
+        return _call_once(candidates[1], messages), candidates[1]
+
+def call_model(deployment: str, messages: List[Dict[str, str]]) -> str:
+    return call_model_served(deployment, messages)[0]
+
+async def acall_model_served(deployment: str, messages: List[Dict[str, str]]) -> Tuple[str, str]:
+    """Async ``call_model_served`` with hedging.
+
+    If the first deployment has not answered by its recent HEDGE_PERCENTILE
+    latency, the same prompt goes to an equivalent deployment and the first
+    success wins; a fast failure fails over straight away. Returns
+    ``(content, served_by)``. Raises ModelAPIError.
+    """
+    candidates = candidate_deployments(deployment)
+    primary = asyncio.ensure_future(_acall_once(candidates[0], messages))
+    tasks = [primary]
+    try:
+        if len(candidates) < 2 or not HEDGING_ENABLED:
+            return await primary, candidates[0]
+        done, _ = await asyncio.wait(tasks, timeout=latency_tracker.hedge_delay(candidates[0]))
+        if done and primary.exception() is None:
+            return primary.result(), candidates[0]
+        if done:
+            MODEL_HEDGES.inc(deployment, "failover")
+            return await _acall_once(candidates[1], messages), candidates[1]
+
+        MODEL_HEDGES.inc(deployment, "hedged")
+        tasks.append(asyncio.ensure_future(_acall_once(candidates[1], messages)))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    MODEL_HEDGES.inc(deployment, "primary_won" if task is primary else "hedge_won")
+                    return task.result(), candidates[0] if task is primary else candidates[1]
+                error = task.exception()
+        raise error
+    finally:
+        # Losers are left to finish: the HTTP call runs on anyway, and its outcome still feeds the breaker and latencies
+        for task in tasks:
+            if not task.done():
+                task.add_done_callback(_discard_result)
+
+async def acall_model(deployment: str, messages: List[Dict[str, str]]) -> str:
+    return (await acall_model_served(deployment, messages))[0]
+
+def _chat_delta(data: Dict[str, Any]) -> str:
+    choices = data.get("choices") or []
+    if not choices:
+        return ""
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+def stream_model(deployment: str, messages: List[Dict[str, str]]) -> Iterator[str]:
+    """Yield the completion token by token using a ``stream: true`` chat request.
+
+    Streams are not hedged, but a deployment with an open breaker is routed around.
+    Deployments without a streaming chat endpoint (Gemini) yield the whole reply once.
+    Raises ModelAPIError if the stream fails, possibly after some tokens.
+    """
+    deployment = candidate_deployments(deployment)[0]
+    model_type, path, payload = _chat_request(deployment, messages)
+    if model_type not in {"gpt", "deepseek"}:
+        yield _call_once(deployment, messages)
+        return
+    _claim(deployment)
+    start, chars, status = time.perf_counter(), 0, "ok"
+    try:
+        for data in get_model_client().stream(BASE_URL, path, {**payload, "stream": True}, headers=_headers()):
+            if delta := _chat_delta(data):
+                chars += len(delta)
+                yield delta
+        circuit_breaker(deployment).record_success()
+    except Exception as e:
+        status = "error"
+        circuit_breaker(deployment).record_failure()
+        print(f"[ERROR] Model {deployment} stream failed: {str(e)}")
+        raise _error(deployment, e) from e
+    finally:
+        observe_model_call(deployment, "stream", status, time.perf_counter() - start, _prompt_chars(messages), chars)
+
+async def astream_model(deployment: str, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+    deployment = candidate_deployments(deployment)[0]
+    model_type, path, payload = _chat_request(deployment, messages)
+    if model_type not in {"gpt", "deepseek"}:
+        yield await _acall_once(deployment, messages)
+        return
+    _claim(deployment)
+    start, chars, status = time.perf_counter(), 0, "ok"
+    try:
+        async for data in get_model_client().astream(BASE_URL, path, {**payload, "stream": True}, headers=_headers()):
+            if delta := _chat_delta(data):
+                chars += len(delta)
+                yield delta
+        circuit_breaker(deployment).record_success()
+    except Exception as e:
+        status = "error"
+        circuit_breaker(deployment).record_failure()
+        print(f"[ERROR] Model {deployment} stream failed: {str(e)}")
+        raise _error(deployment, e) from e
+    finally:
+        observe_model_call(deployment, "stream", status, time.perf_counter() - start, _prompt_chars(messages), chars)
+
+def call_embedding_model(deployment: str, input_text: Union[str, List[str]]) -> List[List[float]]:
+    """Embedding vectors, or ``[]`` on failure. Never hedged: other deployments embed into a different space."""
+    path, payload = _embedding_request(deployment, input_text)
+    chars = len(input_text) if isinstance(input_text, str) else sum(map(len, input_text))
+    if not circuit_breaker(deployment).allow():
+        return []
+    start = time.perf_counter()
+    try:
+        data = get_model_client().post(BASE_URL, path, payload, headers=_headers())
+        circuit_breaker(deployment).record_success()
+        observe_model_call(deployment, "embedding", "ok", time.perf_counter() - start, chars, usage=data.get("usage"))
+        return _embeddings(data)
+    except Exception as e:
+        circuit_breaker(deployment).record_failure()
+        observe_model_call(deployment, "embedding", "error", time.perf_counter() - start, chars)
+        print(f"[ERROR] Embedding model {deployment} call failed: {str(e)}")
         return []
+
+async def acall_embedding_model(deployment: str, input_text: Union[str, List[str]]) -> List[List[float]]:
+    path, payload = _embedding_request(deployment, input_text)
+    chars = len(input_text) if isinstance(input_text, str) else sum(map(len, input_text))
+    if not circuit_breaker(deployment).allow():
+        return []
+    start = time.perf_counter()
+    try:
+        data = await get_model_client().apost(BASE_URL, path, payload, headers=_headers())
+        circuit_breaker(deployment).record_success()
+        observe_model_call(deployment, "embedding", "ok", time.perf_counter() - start, chars, usage=data.get("usage"))
+        return _embeddings(data)
     except Exception as e:
+        circuit_breaker(deployment).record_failure()
+        observe_model_call(deployment, "embedding", "error", time.perf_counter() - start, chars)
         print(f"[ERROR] Embedding model {deployment} call failed: {str(e)}")
         return []
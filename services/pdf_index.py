@@ -0,0 +1,114 @@
+import re
+import threading
+from typing import Dict, List, Tuple
+import numpy as np
+from services.ranking import top_k as best_positions
+from core.config import PDF_CHUNK_WORDS, PDF_CHUNK_OVERLAP, BM25_K1, BM25_B
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+STOPWORDS = frozenset("""
+a an the is are was were be been being am do does did doing have has had having i me my you your he she it its
+we they them their what which who whom this that these those of in on at by for with about into through to from
+up down out over under again then once here there when where why how all any both each few more most other some
+such no nor not only own same so than too very can will just should now and or but if because as until while
+explain tell please give show mean means use used using
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms without stopwords; camelCase identifiers also index their parts."""
+    terms = []
+    for word in _WORD.findall(text):
+        lowered = word.lower()
+        if lowered in STOPWORDS or len(lowered) < 2:
+            continue
+        terms.append(lowered)
+        parts = _CAMEL.findall(word)
+        if len(parts) > 1:
+            terms.extend(p.lower() for p in parts if len(p) > 1 and p.lower() not in STOPWORDS)
+    return terms
+
+def split_page(text: str, size: int = PDF_CHUNK_WORDS, overlap: int = PDF_CHUNK_OVERLAP) -> List[str]:
+    """Overlapping word windows, so a long slide page yields several focused chunks."""
+    words = text.split()
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    step = max(1, size - overlap)
+    return [" ".join(words[i:i + size]) for i in range(0, max(1, len(words) - overlap), step)]
+
+class PDFIndex:
+    """BM25 inverted index over lecture-note chunks, built once and then read-only.
+
+    Every posting stores its precomputed BM25 impact, so a query only touches the
+    postings of its own terms: cost depends on how common the terms are, not on
+    how many pages are indexed.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1, self.b = k1, b
+        self.chunks: List[Tuple[str, int, str]] = []  # (file, page, text)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}  # term -> (chunk ids, impacts)
+        self._lock = threading.Lock()
+
+    def build(self, pdf_chunks: Dict[str, List[str]]):
+        chunks, term_freqs = [], []
+        for fname, pages in (pdf_chunks or {}).items():
+            for page_number, page in enumerate(pages, 1):
+                for text in split_page(page):
+                    tf: Dict[str, int] = {}
+                    for term in tokenize(text):
+                        tf[term] = tf.get(term, 0) + 1
+                    if tf:
+                        chunks.append((fname, page_number, text))
+                        term_freqs.append(tf)
+
+        doc_len = np.array([sum(tf.values()) for tf in term_freqs], dtype=np.float32)
+        avg_len = float(doc_len.mean()) if len(doc_len) else 1.0
+        norm = self.k1 * (1 - self.b + self.b * doc_len / avg_len)
+        raw: Dict[str, Tuple[List[int], List[int]]] = {}
+        for chunk_id, tf in enumerate(term_freqs):
+            for term, count in tf.items():
+                ids, counts = raw.setdefault(term, ([], []))
+                ids.append(chunk_id)
+                counts.append(count)
+
+        postings = {}
+        n = len(chunks)
+        for term, (ids, counts) in raw.items():
+            ids = np.asarray(ids, dtype=np.int32)
+            tf = np.asarray(counts, dtype=np.float32)
+            idf = np.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            postings[term] = (ids, (idf * tf * (self.k1 + 1) / (tf + norm[ids])).astype(np.float32))
+
+        with self._lock:  # swap in whole, so searches never see a half-built index
+            self.chunks, self.postings = chunks, postings
+        print(f"Indexed {n} PDF chunks ({len(postings)} terms)")
+
+    def search(self, query: str, top_k: int) -> List[Tuple[float, Tuple[str, int, str]]]:
+        """Best ``top_k`` chunks as ``(score, (file, page, text))``, at most one per page."""
+        with self._lock:
+            chunks, postings = self.chunks, self.postings
+        hits = [postings[t] for t in dict.fromkeys(tokenize(query)) if t in postings]
+        if not hits:
+            return []
+        ids = np.concatenate([h[0] for h in hits])
+        impacts = np.concatenate([h[1] for h in hits])
+        candidates, inverse = np.unique(ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=impacts)
+
+        # Over-fetch so dropping extra chunks from an already chosen page still leaves top_k
+        results, pages = [], set()
+        for i in best_positions(scores, top_k * 3):
+            chunk = chunks[candidates[i]]
+            if (chunk[0], chunk[1]) in pages:
+                continue
+            pages.add((chunk[0], chunk[1]))
+            results.append((float(scores[i]), chunk))
+            if len(results) == top_k:
+                break
+        return results
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+pdf_index = PDFIndex()
@@ -1,38 +1,36 @@
-import os
-import fitz  # PyMuPDF
-from typing import Dict, List, Any
-from core.config import PDF_DIR
-from core.utils import compress_text
+from typing import Dict, List, Any, Tuple
+from core.config import PDF_DIR, PDF_TOP_K
+from services.pdf_index import pdf_index
+from services.pdf_store import pdf_store
 
 def extract_pdf_chunks() -> Dict[str, List[str]]:
-    pdf_chunks = {}
-    for filename in os.listdir(PDF_DIR):
-        if filename.lower().endswith(".pdf"):
-            full_path = os.path.join(PDF_DIR, filename)
-            try:
-                doc = fitz.open(full_path)
-                pdf_chunks[filename] = [page.get_text().strip() for page in doc]
-            except Exception as e:
-                print(f"Failed to extract {filename}: {e}")
-    return pdf_chunks
+    """Page text per PDF in PDF_DIR; only new or changed files are parsed again."""
+    return {filename: [page.strip() for page in pages] for filename, pages in pdf_store.load_dir(PDF_DIR).items()}
 
-def search_pdf_chunks(chunks: Dict[str, List[str]], query: str) -> (str, List[Dict[str, Any]]):
+def build_pdf_index(chunks: Dict[str, List[str]]):
+    """(Re)build the BM25 index that search_pdf_chunks reads."""
+    pdf_index.build(chunks)
+
+def _format_results(results: List[Tuple[float, Tuple[str, int, str]]]) -> Tuple[str, List[Dict[str, Any]]]:
+    # Whole chunks (split_page already bounds them to PDF_CHUNK_WORDS); pack_snippets enforces the token budget
     matches = []
     context_snippets = []
-
-    for fname, pages in chunks.items():
-        for i, page in enumerate(pages):
-            if query.lower() in page.lower():
-                match = {
-                    "file": fname,
-                    "page": i + 1,
-                    "snippet": page[:500]
-                }
-                matches.append(match)
-                context_snippets.append(f"File: {fname}, Page {i+1}:{page[:500]}")
-            if len(matches) >= 5:
-                break
+    for score, (fname, page, text) in results:
+        match = {
+            "file": fname,
+            "page": page,
+            "snippet": text,
+            "score": round(score, 3)
+        }
+        matches.append(match)
+        context_snippets.append(f"File: {fname}, Page {page}:\n{text}")
 
     context_text = "\n\n".join(context_snippets) or "No relevant PDF content found."
-    context_text = compress_text(context_text, max_lines=30)
     return context_text, matches
+
+def search_pdf_chunks(query: str, top_k: int = PDF_TOP_K) -> Tuple[str, List[Dict[str, Any]]]:
+    """BM25-ranked lecture-note chunks for ``query`` as ``(context_text, matches)``."""
+    return _format_results(pdf_index.search(query, top_k))
+
+def search_pdf_chunks_batch(queries: List[str], top_k: int = PDF_TOP_K) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    return [search_pdf_chunks(query, top_k) for query in queries]
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import fitz  # PyMuPDF
+from core.config import PDF_CACHE_DB_PATH, PDF_EXTRACT_WORKERS, PDF_PAGES_PER_TASK
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _extract_range(path: str, start: int, stop: int) -> List[str]:
+    # Runs in a pool worker; each task opens its own document handle
+    with fitz.open(path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+def extract_many(paths: List[str], workers: int = PDF_EXTRACT_WORKERS,
+                 pages_per_task: int = PDF_PAGES_PER_TASK) -> Tuple[Dict[str, List[str]], Dict[str, Exception]]:
+    """Pages of every PDF in ``paths`` as ``(pages, errors)``, parsed across a process pool.
+
+    Each PDF is cut into ranges of ``pages_per_task`` pages, so one large file still
+    spreads over several cores. Ranges are reassembled in page order and files keep
+    the order of ``paths``, whatever order the workers finish in. A file that fails
+    lands in ``errors`` without affecting the others.
+    """
+    errors: Dict[str, Exception] = {}
+    tasks: List[Tuple[str, int, int]] = []
+    for path in paths:
+        try:
+            with fitz.open(path) as doc:
+                page_count = doc.page_count
+        except Exception as e:
+            errors[path] = e
+            continue
+        tasks.extend((path, start, min(start + pages_per_task, page_count))
+                     for start in range(0, page_count, pages_per_task))
+
+    parts: Dict[str, List[str]] = {path: [] for path in paths if path not in errors}
+    if workers <= 1 or len(tasks) <= 1:
+        # Not worth starting processes for a single range
+        for path, start, stop in tasks:
+            if path in errors:
+                continue
+            try:
+                parts[path].extend(_extract_range(path, start, stop))
+            except Exception as e:
+                errors[path] = e
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            futures = [pool.submit(_extract_range, *task) for task in tasks]
+            for (path, _, _), future in zip(tasks, futures):
+                try:
+                    pages = future.result()
+                except Exception as e:
+                    errors.setdefault(path, e)
+                    continue
+                if path not in errors:
+                    parts[path].extend(pages)
+    return {path: pages for path, pages in parts.items() if path not in errors}, errors
+
+class PDFTextStore:
+    """Persistent cache of extracted page text, shared by the API server and tutor.py.
+
+    Entries are keyed by absolute path. A file whose size and mtime are unchanged
+    is served straight from the store; otherwise its SHA-256 is compared, so a
+    touched but identical file is not re-parsed either. Only new or modified PDFs
+    go through PyMuPDF.
+    """
+
+    def __init__(self, db_path: str = PDF_CACHE_DB_PATH):
+        self.db_path = db_path
+        self.stats = {"hits": 0, "rehashed": 0, "extracted": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS pdf_pages (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            sha256 TEXT NOT NULL,
+            pages TEXT NOT NULL,
+            extracted_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        return conn
+
+    def _cached(self, conn: sqlite3.Connection, path: str) -> Tuple[Optional[List[str]], os.stat_result, Optional[str]]:
+        """Stored pages for ``path`` if still valid (else None), with the file's stat and hash."""
+        st = os.stat(path)
+        row = conn.execute("SELECT size, mtime, sha256, pages FROM pdf_pages WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime:
+            self.stats["hits"] += 1
+            return json.loads(row[3]), st, row[2]
+
+        digest = file_hash(path)
+        if row and row[2] == digest:
+            self.stats["rehashed"] += 1
+            pages = json.loads(row[3])
+            self._save(conn, path, st, digest, pages)  # remember the new mtime
+            return pages, st, digest
+        return None, st, digest
+
+    def _save(self, conn: sqlite3.Connection, path: str, st: os.stat_result, digest: str, pages: List[str]):
+        conn.execute(
+            "INSERT OR REPLACE INTO pdf_pages (path, size, mtime, sha256, pages, extracted_at) "
+            "VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+            (path, st.st_size, st.st_mtime, digest, json.dumps(pages))
+        )
+
+    def get_pages(self, path: str, workers: int = PDF_EXTRACT_WORKERS) -> List[str]:
+        """Page text of one PDF; a new or changed file is parsed by ``extract_many``,
+        so a large one is still split into page ranges across the pool."""
+        path = os.path.abspath(path)
+        with self._connect() as conn:
+            pages, st, digest = self._cached(conn, path)
+            if pages is None:
+                extracted, errors = extract_many([path], workers)
+                if path in errors:
+                    raise errors[path]
+                pages = extracted[path]
+                self.stats["extracted"] += 1
+                self._save(conn, path, st, digest, pages)
+            return pages
+
+    def load_dir(self, directory: str, workers: int = PDF_EXTRACT_WORKERS) -> Dict[str, List[str]]:
+        """``{filename: pages}`` for every PDF in ``directory``, sorted by filename.
+
+        New or changed files are parsed in parallel by ``extract_many``; files that
+        fail are logged and left out.
+        """
+        directory = os.path.abspath(directory)
+        self.stats = dict.fromkeys(self.stats, 0)
+        filenames = sorted(f for f in os.listdir(directory) if f.lower().endswith(".pdf"))
+        pdf_pages: Dict[str, List[str]] = {}
+        with self._connect() as conn:
+            pending = {}  # path -> (stat, digest)
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    pages, st, digest = self._cached(conn, path)
+                except OSError as e:
+                    print(f"Failed to extract {filename}: {e}")
+                    continue
+                if pages is None:
+                    pending[path] = (st, digest)
+                else:
+                    pdf_pages[filename] = pages
+
+            extracted, errors = extract_many(list(pending), workers)
+            for path, pages in extracted.items():
+                self._save(conn, path, *pending[path], pages)
+                pdf_pages[os.path.basename(path)] = pages
+            for path, e in errors.items():
+                print(f"Failed to extract {os.path.basename(path)}: {e}")
+            self.stats["extracted"] = len(extracted)
+
+            # Forget PDFs that were removed from the directory
+            stale = [path for (path,) in conn.execute("SELECT path FROM pdf_pages")
+                     if os.path.dirname(path) == directory and os.path.basename(path) not in filenames]
+            conn.executemany("DELETE FROM pdf_pages WHERE path = ?", [(p,) for p in stale])
+        print(f"PDF text store: {self.stats['hits']} cached, {self.stats['rehashed']} unchanged after hashing, "
+              f"{self.stats['extracted']} extracted")
+        return {filename: pdf_pages[filename] for filename in filenames if filename in pdf_pages}
+
+pdf_store = PDFTextStore()
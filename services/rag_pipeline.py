@@ -1,56 +1,109 @@
 import json
-import numpy as np
-# from sklearn.feature_extraction.text import TfidfVectorizer
-# from sklearn.metrics.pairwise import cosine_similarity
-
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-
-from core.config import JSON_DATA, JSON_PATH
-from typing import List, Dict, Any
+from core.config import JSON_PATH
+from services.bm25f import BM25FIndex, index_params
+from services.index_manager import IndexManager
+from services.index_store import corpus_fingerprint, load_index, save_index
+from services.metrics import register_collector
+from services.ranking import top_k_rows
+from typing import List, Dict, Any, Optional
 
 # JSON Knowledge Base
-def load_json_data():
-    global JSON_DATA
+def load_json_data() -> List[Dict[str, Any]]:
     try:
         # Load both JSON knowledge bases
         with open("raw_java8_data.json", "r") as f1, open("raw_java8_data_copy.json", "r") as f2:
-            JSON_DATA = json.load(f1) + json.load(f2)
-        print(f"Loaded {len(JSON_DATA)} JSON knowledge entries")
+            entries = json.load(f1) + json.load(f2)
+        print(f"Loaded {len(entries)} JSON knowledge entries")
+        return entries
     except Exception as e:
         print(f"Error loading JSON data: {str(e)}")
-        JSON_DATA = []
+        return []
 
-# Initialize TF-IDF vectorizer (using cuML for GPU acceleration)
-vectorizer = TfidfVectorizer(stop_words='english')
-tfidf_matrix = None
+class JSONIndex:
+    """Entries with their own BM25F postings; read-only once built."""
 
-def build_tfidf_matrix():
-    global tfidf_matrix
-    corpus = [json.dumps(entry) for entry in JSON_DATA]
-    # Fit and transform on GPU
-    tfidf_matrix = vectorizer.fit_transform(corpus)
+    def __init__(self, entries: List[Dict[str, Any]], bm25f: BM25FIndex):
+        self.entries = entries
+        self.bm25f = bm25f
 
-def search_json_content(query: str, top_k: int = 5) -> str:
-    if not JSON_DATA:
-        return "No JSON data available"
-    
-    # Transform query on GPU
-    query_vec = vectorizer.transform([query])
-    
-    # Perform cosine similarity on GPU using cuML
-    cos_sim = cosine_similarity(query_vec, tfidf_matrix)
-    
-    top_indices = np.argsort(cos_sim[0])[-top_k:][::-1]
-    
-    results = []
-    for idx in top_indices:
-        entry = JSON_DATA[idx]
-        if 'question' in entry and 'answer' in entry:
-            results.append(f"Q: {entry['question']}\nA: {entry['answer']}")
-        elif 'title' in entry and 'content' in entry:
-            results.append(f"{entry['title']}:\n{entry['content']}")
-        else:
-            results.append(str(entry))
+    def append(self, entries: List[Dict[str, Any]]) -> "JSONIndex":
+        return JSONIndex(self.entries + entries, self.bm25f.append(entries))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+def _build_snapshot(entries: List[Dict[str, Any]]) -> JSONIndex:
+    """Snapshot for ``entries``, loaded from JSON_INDEX_DIR when the corpus is unchanged, indexed otherwise."""
+    fingerprint = corpus_fingerprint(entries, index_params())
+    loaded = load_index(fingerprint)
+    if loaded:
+        print(f"Loaded JSON index from disk ({fingerprint[:12]})")
+        terms, postings, stats = loaded
+        return JSONIndex(entries, BM25FIndex(terms, [postings], stats["idf"], stats["avg_len"]))
+    bm25f = BM25FIndex.build(entries)
+    print(f"Built BM25F index: {len(bm25f.terms)} terms, {bm25f.postings.nnz} postings")
+    try:
+        save_index(fingerprint, bm25f.terms, bm25f.postings, {"idf": bm25f.idf, "avg_len": bm25f.avg_len})
+    except OSError as e:
+        print(f"Could not save JSON index artifacts: {e}")
+    return JSONIndex(entries, bm25f)
+
+json_index: IndexManager[JSONIndex] = IndexManager("json", _build_snapshot)
+register_collector(
+    "retrieval_index_version", "Snapshot generation currently served by a hot-swapped index", ("index",),
+    lambda: {("json", ): float(json_index.version)},
+)
+register_collector(
+    "retrieval_index_snapshot_building", "1 while a rebuild or append is preparing the next snapshot", ("index",),
+    lambda: {("json", ): float(json_index.building)},
+)
+register_collector(
+    "retrieval_index_snapshot_seconds", "Time taken to prepare the snapshot currently served", ("index",),
+    lambda: {("json", ): json_index.last_build_seconds} if json_index.last_build_seconds is not None else {},
+)
+
+def build_json_index(entries: List[Dict[str, Any]]) -> JSONIndex:
+    """Index ``entries`` as a new snapshot and swap it in; searches already running finish on the old one.
+
+    This is also the compaction step: it merges appended segments and recomputes IDF.
+    """
+    return json_index.rebuild(entries)
+
+def refresh_json_index(entries: List[Dict[str, Any]]) -> JSONIndex:
+    """Bring the index in line with ``entries``, the whole corpus as now on disk.
+
+    When it only extends the corpus being served, just the new tail is indexed;
+    any other change (edits, deletions, reordering) needs a full rebuild.
+    """
+    current = json_index.current()
+    if current is not None and entries == current.entries:
+        return current
+    def refresh(current: Optional[JSONIndex]) -> JSONIndex:
+        if current is not None and len(entries) > len(current) and entries[:len(current)] == current.entries:
+            return current.append(entries[len(current):])
+        return _build_snapshot(entries)
+    return json_index.update(refresh)
+
+def _format_entry(entry: Dict[str, Any]) -> str:
+    if 'question' in entry and 'answer' in entry:
+        return f"Q: {entry['question']}\nA: {entry['answer']}"
+    if 'title' in entry and 'content' in entry:
+        return f"{entry['title']}:\n{entry['content']}"
+    return str(entry)
+
+def search_json_snippets_batch(queries: List[str], top_k: int = 5) -> List[List[str]]:
+    """Top-k snippets for every query, scored in one sparse matrix product."""
+    index = json_index.current()  # one snapshot for the whole batch, even if a refresh lands meanwhile
+    if not index or not queries:
+        return [[] for _ in queries]
     
-    return "\n\n".join(results)[:10000]
+    # One row per query, so the whole batch is a single sparse product over the postings
+    scores = index.bm25f.score(queries)
+    top_indices = top_k_rows(scores, top_k)
+    # Entries sharing no term with the query score 0 and are not worth any tokens
+    return [[_format_entry(index.entries[idx]) for idx in row if scores[i, idx] > 0]
+            for i, row in enumerate(top_indices)]
+
+def search_json_snippets(query: str, top_k: int = 5) -> List[str]:
+    """Top-k entries formatted as whole snippets, best first."""
+    return search_json_snippets_batch([query], top_k)[0]
@@ -0,0 +1,25 @@
+import numpy as np
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the ``k`` highest ``scores``, best first (equal scores in position order).
+
+    ``argpartition`` selects the candidates in O(n), and only those ``k`` get sorted.
+    """
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    best = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+    return best[np.lexsort((best, -scores[best]))]
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """``top_k`` for every row of a ``(queries, candidates)`` score matrix, as a ``(queries, k)`` array."""
+    rows, n = scores.shape
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((rows, 0), dtype=np.intp)
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k < n else np.tile(np.arange(n), (rows, 1))
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    # Sort each row's k candidates by score, then position, as top_k does
+    order = np.lexsort((best, -best_scores), axis=1)
+    return np.take_along_axis(best, order, axis=1)
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List
+import numpy as np
+from services.metrics import register_collector
+from core.config import (
+    MODEL_EQUIVALENTS, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES, HEDGE_WINDOW, HEDGE_DEFAULT_DELAY, HEDGE_MIN_DELAY,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_COOLDOWN,
+)
+
+class ModelAPIError(Exception):
+    """A model call failed; raised instead of returning an error string."""
+
+    def __init__(self, deployment: str, message: str):
+        super().__init__(f"{deployment}: {message}")
+        self.deployment = deployment
+
+class ModelTimeoutError(ModelAPIError):
+    """The deployment did not answer in time."""
+
+class CircuitOpenError(ModelAPIError):
+    """Every candidate deployment's breaker is open, so no call was made."""
+
+class CircuitBreaker:
+    """Consecutive-failure breaker for one deployment.
+
+    ``closed`` lets everything through. ``CIRCUIT_FAILURE_THRESHOLD`` failures in a
+    row open it for ``CIRCUIT_COOLDOWN`` seconds, after which one trial call is
+    allowed (``half_open``); its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, deployment: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 cooldown: float = CIRCUIT_COOLDOWN):
+        self.deployment = deployment
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.stats = {"opened": 0, "rejected": 0}
+        self._lock = threading.Lock()
+
+    def _trial_due(self) -> bool:
+        # Open long enough for a trial, or a previous trial never reported back
+        return self.state != "closed" and time.monotonic() - self.opened_at >= self.cooldown
+
+    def available(self) -> bool:
+        """Whether a call could go through right now, without claiming the trial."""
+        with self._lock:
+            return self.state == "closed" or self._trial_due()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self._trial_due():
+                self.state, self.opened_at = "half_open", time.monotonic()  # this caller is the trial
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state, self.failures = "closed", 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.stats["opened"] += 1
+                    print(f"[CIRCUIT] {self.deployment} open after {self.failures} failures")
+                self.state, self.opened_at = "open", time.monotonic()
+
+class LatencyTracker:
+    """Recent successful call latencies per deployment, for choosing when to hedge."""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, deployment: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(deployment, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, deployment: str, percentile: float = HEDGE_PERCENTILE) -> float:
+        with self._lock:
+            samples = list(self._samples.get(deployment, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, float(np.percentile(samples, percentile)))
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+latency_tracker = LatencyTracker()
+
+def circuit_breaker(deployment: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if deployment not in _breakers:
+            _breakers[deployment] = CircuitBreaker(deployment)
+        return _breakers[deployment]
+
+def candidate_deployments(deployment: str) -> List[str]:
+    """``deployment`` and its equivalents, skipping any whose breaker is open.
+
+    Raises CircuitOpenError when none is available.
+    """
+    candidates = [d for d in [deployment] + MODEL_EQUIVALENTS.get(deployment, []) if circuit_breaker(d).available()]
+    if not candidates:
+        raise CircuitOpenError(deployment, "circuit open for the deployment and all its equivalents")
+    return candidates
+
+def breaker_stats() -> Dict[str, Dict[str, object]]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {b.deployment: {"state": b.state, "failures": b.failures, **b.stats} for b in breakers}
+
+register_collector(
+    "model_circuit_open", "1 while a deployment's circuit breaker is open or half-open", ("deployment",),
+    lambda: {(name, ): float(st["state"] != "closed") for name, st in breaker_stats().items()},
+)
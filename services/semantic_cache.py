@@ -0,0 +1,151 @@
+import hashlib
+import re
+import threading
+from typing import Dict, List, Optional, Any
+import numpy as np
+from sqlalchemy.orm import Session
+from models import SemanticCacheEntry
+from services.model_service import acall_embedding_model
+from core.config import (
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_MODEL, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES,
+)
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop sentence punctuation and collapse whitespace.
+
+    Operators such as ``++`` or ``->`` are kept because they change the meaning of a Java question.
+    """
+    query = re.sub(r"[?!,;:\"'`]+", " ", query.lower())
+    query = re.sub(r"\.(\s|$)", " ", query)
+    return " ".join(query.split())
+
+class SemanticCache:
+    """Maps a query to an earlier, equivalent query whose pipeline stages are already cached.
+
+    Lookups first try an exact match on the normalised text, then a cosine-similarity
+    search over the embeddings of previously answered queries. The index is a single
+    L2-normalised float32 matrix kept in memory and persisted in the ``semantic_cache`` table.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, model: str = SEMANTIC_CACHE_MODEL,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.model = model
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._keys: List[str] = []
+        self._by_normalized: Dict[str, str] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "embedding_failures": 0}
+
+    def _ensure_loaded(self, db: Session):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            rows = db.query(SemanticCacheEntry).order_by(SemanticCacheEntry.created_at).all()
+            self._keys = [r.cache_key for r in rows]
+            self._by_normalized = {r.normalized: r.cache_key for r in rows}
+            if rows:
+                self._matrix = np.vstack([np.frombuffer(r.embedding, dtype=np.float32) for r in rows])
+            self._loaded = True
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        vectors = await acall_embedding_model(self.model, text)
+        if not vectors:
+            self.stats["embedding_failures"] += 1
+            return None
+        vector = np.asarray(vectors[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    async def lookup(self, query: str, db: Session) -> Dict[str, Any]:
+        """Return ``{"cache_key", "similarity", "embedding"}``; ``cache_key`` is None on a miss.
+
+        The embedding is handed back so a miss can be added later without embedding twice.
+        """
+        if not SEMANTIC_CACHE_ENABLED:
+            return {"cache_key": None, "similarity": 0.0, "embedding": None}
+        self._ensure_loaded(db)
+        normalized = normalize_query(query)
+        if key := self._by_normalized.get(normalized):
+            self.stats["exact_hits"] += 1
+            return {"cache_key": key, "similarity": 1.0, "embedding": None}
+
+        embedding = await self._embed(normalized)
+        matrix, keys = self._matrix, self._keys
+        if embedding is not None and len(keys) and matrix.shape[1] == embedding.shape[0]:
+            scores = matrix @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                self.stats["semantic_hits"] += 1
+                return {"cache_key": keys[best], "similarity": float(scores[best]), "embedding": embedding}
+        self.stats["misses"] += 1
+        return {"cache_key": None, "similarity": 0.0, "embedding": embedding}
+
+    async def add(self, query: str, db: Session, embedding: Optional[np.ndarray] = None):
+        """Register ``query`` (the key its stages were cached under) as a reusable answer."""
+        if not SEMANTIC_CACHE_ENABLED:
+            return
+        self._ensure_loaded(db)
+        normalized = normalize_query(query)
+        if normalized in self._by_normalized:
+            return
+        if embedding is None:
+            embedding = await self._embed(normalized)
+            if embedding is None:
+                return
+        query_hash = hashlib.md5(query.encode()).hexdigest()
+        db.merge(SemanticCacheEntry(query_hash=query_hash, cache_key=query, normalized=normalized,
+                                    embedding=embedding.astype(np.float32).tobytes()))
+        db.commit()
+        with self._lock:
+            row = embedding.astype(np.float32)[None, :]
+            self._matrix = row if not self._keys else np.vstack([self._matrix, row])
+            self._keys = self._keys + [query]
+            self._by_normalized[normalized] = query
+        if len(self._keys) > self.max_entries:
+            self._evict_oldest(db, len(self._keys) - self.max_entries)
+
+    def _evict_oldest(self, db: Session, count: int):
+        with self._lock:
+            evicted, self._keys = self._keys[:count], self._keys[count:]
+            self._matrix = self._matrix[count:]
+            gone = set(evicted)
+            self._by_normalized = {n: k for n, k in self._by_normalized.items() if k not in gone}
+        hashes = [hashlib.md5(k.encode()).hexdigest() for k in evicted]
+        db.query(SemanticCacheEntry).filter(SemanticCacheEntry.query_hash.in_(hashes)).delete(synchronize_session=False)
+        db.commit()
+
+    def invalidate(self, db: Session, query: Optional[str] = None) -> List[str]:
+        """Drop the entry matching ``query`` (by normalised text), or every entry when omitted.
+
+        Returns the cache keys that were removed so callers can purge their stages too.
+        """
+        self._ensure_loaded(db)
+        with self._lock:
+            if query is None:
+                removed = list(self._keys)
+            else:
+                key = self._by_normalized.get(normalize_query(query))
+                removed = [key] if key else []
+            keep = [i for i, k in enumerate(self._keys) if k not in removed]
+            self._matrix = self._matrix[keep] if keep else np.zeros((0, 0), dtype=np.float32)
+            self._keys = [self._keys[i] for i in keep]
+            self._by_normalized = {n: k for n, k in self._by_normalized.items() if k not in removed}
+        if query is None:
+            db.query(SemanticCacheEntry).delete()
+        elif removed:
+            db.query(SemanticCacheEntry).filter_by(query_hash=hashlib.md5(removed[0].encode()).hexdigest()).delete()
+        db.commit()
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = sum(self.stats[k] for k in ("exact_hits", "semantic_hits", "misses"))
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        return {**self.stats, "entries": len(self._keys), "threshold": self.threshold,
+                "hit_rate": hits / lookups if lookups else 0.0}
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,25 @@
+import asyncio
+import services.model_service as model_service
+from services.model_service import ModelAPIError, acall_model_served, call_model_served
+
+def _patch(monkeypatch, failing):
+    def call_once(deployment, messages):
+        if deployment in failing:
+            raise ModelAPIError(deployment, "down")
+        return f"answer from {deployment}"
+
+    async def acall_once(deployment, messages):
+        return call_once(deployment, messages)
+
+    monkeypatch.setattr(model_service, "candidate_deployments", lambda deployment: [deployment, "gpt-4.1"])
+    monkeypatch.setattr(model_service, "_call_once", call_once)
+    monkeypatch.setattr(model_service, "_acall_once", acall_once)
+
+def test_failover_reports_the_deployment_that_answered(monkeypatch):
+    _patch(monkeypatch, failing={"gpt-5"})
+    assert call_model_served("gpt-5", []) == ("answer from gpt-4.1", "gpt-4.1")
+    assert asyncio.run(acall_model_served("gpt-5", [])) == ("answer from gpt-4.1", "gpt-4.1")
+
+def test_primary_answer_is_credited_to_the_primary(monkeypatch):
+    _patch(monkeypatch, failing=set())
+    assert asyncio.run(acall_model_served("gpt-5", [])) == ("answer from gpt-5", "gpt-5")
@@ -0,0 +1,62 @@
+import asyncio
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import routers.rag as rag
+from database import Base
+from services.cache_service import StageCache
+
+QUERY = "How does a HashMap handle collisions?"
+
+def _run(db):
+    async def collect():
+        return [event async for event in rag._rag_events(QUERY, db)]
+    return asyncio.run(collect())
+
+def test_degraded_compression_is_redone_once_the_index_is_ready(monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    ready = {"json"}
+    compressed = []
+
+    async def call(model, messages, stage):
+        if stage == "routing":
+            return "pdf, json"
+        if stage == "compression":
+            compressed.append(messages[-1]["content"])
+            return f"narrowed #{len(compressed)}"
+        return "HashMap chains colliding keys in buckets."
+
+    async def acall_model_served(model, messages):
+        return "HashMap chains colliding keys in buckets.", model
+
+    async def lookup(query, db):
+        return {"embedding": None, "cache_key": None, "similarity": 0.0}
+
+    async def add(query, db, embedding=None):
+        pass
+
+    monkeypatch.setattr(rag, "stage_cache", StageCache())
+    monkeypatch.setattr(rag, "index_ready", lambda name: name in ready)
+    monkeypatch.setattr(rag, "_call", call)
+    monkeypatch.setattr(rag, "acall_model_served", acall_model_served)
+    monkeypatch.setattr(rag, "astream_model", None)
+    monkeypatch.setattr(rag, "FAST_MODE", "off")
+    monkeypatch.setattr(rag.semantic_cache, "lookup", lookup)
+    monkeypatch.setattr(rag.semantic_cache, "add", add)
+    monkeypatch.setattr(rag, "search_json_snippets", lambda query: ["JSON: buckets hold linked entries"])
+    monkeypatch.setattr(rag, "search_pdf_chunks", lambda query: (
+        "PDF context", [{"file": "week5.pdf", "page": 3, "snippet": "PDF: treeified buckets"}]))
+
+    first = _run(db)[-1]["data"]
+    assert first["debug_log"]["degraded"] == ["pdf"]
+    assert "narrowed" not in rag.stage_cache.load(QUERY, db)
+    assert "final_result" not in rag.stage_cache.load(QUERY, db)
+
+    ready.add("pdf")
+    second = _run(db)[-1]["data"]
+    assert "degraded" not in second["debug_log"]
+    assert len(compressed) == 2
+    assert "PDF: treeified buckets" in compressed[1]
+    assert second["debug_log"]["compressed_context"] == "narrowed #2"
+    assert rag.stage_cache.load(QUERY, db)["narrowed"] == "narrowed #2"
@@ -0,0 +1,28 @@
+import pytest
+import core.utils as utils
+from core.utils import count_tokens, truncate_to_tokens
+from services.context_packer import pack_snippets
+
+JAVA = """public class Counter {
+    private final Map<String, Integer> counts = new HashMap<>();
+    public void add(String key) { counts.merge(key, 1, Integer::sum); }
+}"""
+PROSE = ("A HashMap stores entries in buckets chosen by hashCode(); since Java 8 a bucket with "
+         "more than 8 entries becomes a red-black tree, so lookups stay O(log n) under collisions.")
+
+@pytest.fixture(autouse=True)
+def heuristic_counts(monkeypatch):
+    # The path every deployment takes when tiktoken is not installed
+    monkeypatch.setattr(utils, "_ENCODING", None)
+
+@pytest.mark.parametrize("budget", [1, 5, 17, 40, 120])
+def test_truncate_to_tokens_stays_within_budget(budget):
+    for text in (JAVA, PROSE, PROSE.replace(" ", "") * 3, "\n".join([JAVA, PROSE] * 4)):
+        truncated = truncate_to_tokens(text, budget)
+        assert count_tokens(truncated) <= budget
+        assert text.startswith(truncated)
+
+@pytest.mark.parametrize("budget", [1, 30, 60, 200])
+def test_pack_snippets_stays_within_budget(budget):
+    snippets = [JAVA, PROSE, "Q: What is autoboxing?\nA: Converting int to Integer automatically.", JAVA * 3]
+    assert count_tokens(pack_snippets(snippets, budget)) <= budget
@@ -1,9 +1,9 @@
 import os
-import fitz  # PyMuPDF
 import json
 import requests
 import re
 from tqdm import tqdm
+from services.pdf_store import pdf_store
 
 PDF_DIR = "/Users/hei/IdeaProjects/fyp/frontend/Lecture Notes-20250622"
 OUTPUT_DIR = "./lessons_raw"
@@ -13,8 +13,9 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # Step 1: Extract all text
 def extract_text_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
-    return "\n\n".join([page.get_text() for page in doc if page.get_text().strip()])
+    # Shared with the API server; a new or changed file is parsed in page ranges across PDF_EXTRACT_WORKERS
+    pages = pdf_store.get_pages(pdf_path)
+    return "\n\n".join(page for page in pages if page.strip())
 
 # Step 2: Optional content generation via Ollama
 def call_ollama(prompt: str) -> str: